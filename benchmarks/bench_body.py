@@ -0,0 +1,104 @@
+"""Parsing dataset bodies and sql results, directly and through loaders"""
+
+import io
+
+from harness import benchmark
+import synthetic
+
+from qri import body, dataset, dsref, loader
+import fake_qri
+import mock_server
+
+
+REF = dsref.Ref('peer', 'bench')
+
+SHAPES = [
+    ('small', 1000, 5),
+    ('large', 100000, 5),
+    ('wide', 10000, 50),
+]
+
+
+class Body(object):
+    def __init__(self, fmt, count, width, dirty=False):
+        encode = synthetic.csv_body if fmt == 'csv' else synthetic.json_body
+        self.data = encode(count, width, dirty)
+        self.structure = dataset.Structure(
+            synthetic.structure_obj(fmt, count, width))
+
+
+def register_read(fmt, label, count, width, dirty=False):
+    kind = 'fallback' if dirty else 'typed'
+
+    @benchmark('body.read %s %s %s' % (fmt, kind, label),
+               setup=lambda: Body(fmt, count, width, dirty), repeat=3)
+    def read(state):
+        body.read(io.BytesIO(state.data), state.structure)
+
+
+for label, count, width in SHAPES:
+    register_read('csv', label, count, width)
+    register_read('json', label, count // 10, width)
+register_read('csv', 'large', 100000, 5, dirty=True)
+
+
+@benchmark('body.read csv columns=2 large', repeat=3,
+           setup=lambda: Body('csv', 100000, 5))
+def read_columns(state):
+    body.read(io.BytesIO(state.data), state.structure,
+              columns=['col_0', 'col_1'])
+
+
+class Binary(object):
+    """A fake qri binary serving a csv body"""
+    def __init__(self, count, width):
+        self.body = Body('csv', count, width)
+        self.qri = fake_qri.FakeQri({
+            'get body peer/bench': self.body.data.decode('utf-8'),
+        }).__enter__()
+        self.repo = loader.LocalQriBinaryRepo()
+
+    def close(self):
+        self.qri.__exit__()
+
+
+@benchmark('binary load_body csv 10000x5', repeat=3,
+           setup=lambda: Binary(10000, 5))
+def binary_load_body(state):
+    state.repo.load_body(REF, state.body.structure)
+
+
+class Server(object):
+    """A local http stand-in for a qri API server"""
+    def __init__(self, count, width):
+        self.body = Body('csv', count, width)
+        self.server = mock_server.MockServer().start()
+        self.server.add('GET', '/get/peer/bench', self.body.data,
+                        content_type='text/csv')
+        self.server.add('POST', '/sql', self.body.data,
+                        content_type='text/csv')
+        self.repo = loader.LocalAPIRepo(self.server.url)
+        self.types = {'col_%d' % n: body.pd_type(t['type'])
+                      for n, t in enumerate(
+                          self.body.structure.schema['items']['items'])}
+
+    def close(self):
+        self.server.stop()
+
+
+@benchmark('api load_body csv 100000x5', repeat=3,
+           setup=lambda: Server(100000, 5))
+def api_load_body(state):
+    state.repo.load_body(REF, state.body.structure)
+
+
+@benchmark('api sql result 100000x5', repeat=3,
+           setup=lambda: Server(100000, 5))
+def api_sql(state):
+    state.repo.sql('SELECT * FROM peer/bench', state.types)
+
+
+@benchmark('read_result_csv 100000x5', repeat=3,
+           setup=lambda: Server(100000, 5))
+def read_result(state):
+    body.read_result_csv(io.BytesIO(state.body.data), state.types)
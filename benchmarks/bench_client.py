@@ -0,0 +1,48 @@
+"""Listing, dataset construction and readme rendering"""
+
+from harness import benchmark
+import synthetic
+
+from qri import client, dataset, loader
+import mock_loader
+
+
+class Listing(object):
+    def __init__(self, count):
+        loader.set_instance(mock_loader.SettableLoader(
+            list_response=synthetic.list_objs(count)))
+
+    def close(self):
+        loader.set_instance(None)
+
+
+@benchmark('client.list 50000', setup=lambda: Listing(50000), repeat=3)
+def list_datasets(state):
+    client.list()
+
+
+GET_OBJ = {
+    'username': 'peer',
+    'name': 'bench',
+    'path': '/ipfs/QmPath',
+    'bodyPath': '/ipfs/QmBodyPath',
+    'commit': {'message': 'message', 'title': 'title'},
+    'meta': {'title': 'Bench', 'description': 'description'},
+    'readme': {'scriptBytes': 'IyBIZWxsbwoKY29udGVudA=='},
+    'structure': synthetic.structure_obj('csv', 10, 5),
+}
+
+
+@benchmark('Dataset from get 10000', number=1, repeat=5)
+def construct_datasets(state):
+    for _ in range(10000):
+        d = dataset.Dataset(GET_OBJ)
+        d.meta
+        d.structure
+
+
+@benchmark('Readme.render', number=20, repeat=5,
+           setup=lambda: dataset.Readme({'scriptBytes': ''}))
+def render_readme(readme):
+    readme.script = synthetic.README
+    readme.render()
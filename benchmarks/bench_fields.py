@@ -0,0 +1,62 @@
+"""Micro-benchmark of building components from json objects, comparing the
+   precomputed field mapping against snake-casing every field on every
+   call"""
+
+import re
+
+from harness import benchmark
+
+from qri import dataset, version_info
+
+
+COUNT = 100000
+
+LIST_OBJ = {
+    'username': 'peer',
+    'name': 'a_dataset',
+    'profileID': 'QmProfileID',
+    'path': '/ipfs/QmPath',
+    'bodySize': 1024,
+    'bodyRows': 10,
+    'bodyFormat': 'csv',
+    'numErrors': 0,
+    'metaTitle': 'A dataset',
+    'commitTime': '2020-08-24T20:00:32.171549113Z',
+}
+
+
+def regex_set_fields(inst, obj, fields):
+    """How fields were set before the mapping was precomputed"""
+    field_list = []
+    for f in fields:
+        name = re.sub(r'([^A-Z])([A-Z])', r'\1_\2', f).lower()
+        field_list.append(name)
+        setattr(inst, name, obj.get(f))
+    inst._fields = field_list
+
+
+class RegexVersionInfo(object):
+    def __init__(self, obj):
+        regex_set_fields(self, obj, version_info.VersionInfo.FIELDS)
+
+
+def objs():
+    return [dict(LIST_OBJ, name='dataset_%d' % n) for n in range(COUNT)]
+
+
+@benchmark('VersionInfo regex 100000', setup=objs, repeat=1)
+def regex_version_info(objs):
+    for o in objs:
+        RegexVersionInfo(o)
+
+
+@benchmark('VersionInfo field map 100000', setup=objs, repeat=3)
+def field_map_version_info(objs):
+    for o in objs:
+        version_info.VersionInfo(o)
+
+
+@benchmark('Dataset from listing 100000', setup=objs, repeat=3)
+def dataset_from_listing(objs):
+    for o in objs:
+        dataset.Dataset(o)
@@ -0,0 +1,89 @@
+"""A small benchmark harness: cases are registered with a decorator, timed
+   with timeit, and their results stored as json keyed by git commit so runs
+   of different commits can be compared"""
+
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# The package, and the stand-ins used by the tests, are imported from the
+# source tree
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+
+_cases = []
+
+
+def benchmark(name, setup=None, number=1, repeat=5):
+    """Register a benchmark. setup is called once and its result passed to
+       the benchmarked function, which is timed for the best of repeat runs
+       of number calls each"""
+    def register(func):
+        _cases.append((name, func, setup, number, repeat))
+        return func
+    return register
+
+
+def cases():
+    return list(_cases)
+
+
+def run(pattern=None, out=sys.stdout):
+    """Run every registered case whose name contains pattern, return a
+       mapping of name to seconds per call"""
+    results = {}
+    for name, func, setup, number, repeat in _cases:
+        if pattern and pattern not in name:
+            continue
+        state = setup() if setup else None
+        try:
+            times = timeit.repeat(lambda: func(state), number=number,
+                                  repeat=repeat)
+        finally:
+            if hasattr(state, 'close'):
+                state.close()
+        results[name] = min(times) / number
+        out.write('%-48s %12.6fs\n' % (name, results[name]))
+        out.flush()
+    return results
+
+
+def current_commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                      cwd=ROOT, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return out.decode('utf-8').strip()
+
+
+def save(results, commit):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    filename = os.path.join(RESULTS_DIR, '%s.json' % commit)
+    with open(filename, 'w') as fp:
+        json.dump({'commit': commit, 'python': sys.version.split()[0],
+                   'results': results}, fp, indent=2, sort_keys=True)
+    return filename
+
+
+def load(commit):
+    filename = os.path.join(RESULTS_DIR, '%s.json' % commit)
+    with open(filename) as fp:
+        return json.load(fp)['results']
+
+
+def compare(base, results, out=sys.stdout):
+    """Print each result next to the same case from an earlier run"""
+    for name in sorted(results):
+        if name not in base:
+            continue
+        ratio = results[name] / base[name] if base[name] else float('inf')
+        out.write('%-48s %12.6fs %12.6fs %7.2fx\n' % (name, base[name],
+                                                      results[name], ratio))
@@ -0,0 +1,39 @@
+"""Run the benchmarks and store the results for the current commit.
+
+usage: python benchmarks/run.py [-k PATTERN] [--compare COMMIT] [--no-save]
+"""
+
+import argparse
+import glob
+import importlib
+import os
+import sys
+
+import harness
+
+
+def main():
+    parser = argparse.ArgumentParser(description='run qri benchmarks')
+    parser.add_argument('-k', dest='pattern', default=None,
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('--compare', metavar='COMMIT', default=None,
+                        help='compare against the stored results of a commit')
+    parser.add_argument('--no-save', action='store_true',
+                        help="don't store the results")
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(glob.glob(os.path.join(here, 'bench_*.py'))):
+        importlib.import_module(os.path.basename(filename)[:-3])
+
+    results = harness.run(args.pattern)
+    if not args.no_save:
+        commit = harness.current_commit()
+        print('saved %s' % harness.save(results, commit))
+    if args.compare:
+        print('\ncompared with %s:' % args.compare)
+        harness.compare(harness.load(args.compare), results)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""Synthetic dataset bodies and objects for benchmarks"""
+
+import json
+import random
+
+
+def schema(width, types=('string', 'integer', 'number', 'boolean')):
+    items = []
+    for n in range(width):
+        items.append({'title': 'col_%d' % n, 'type': types[n % len(types)]})
+    return {'type': 'array', 'items': {'type': 'array', 'items': items}}
+
+
+def structure_obj(fmt, rows, width):
+    return {
+        'format': fmt,
+        'formatConfig': {'headerRow': True} if fmt == 'csv' else None,
+        'entries': rows,
+        'schema': schema(width),
+    }
+
+
+def value(t, n, rng, dirty):
+    if dirty and n % 97 == 0:
+        # A value that doesn't match the schema, forcing a fallback
+        return 'n/a'
+    if t == 'string':
+        return 'value %d' % rng.randint(0, 1000)
+    if t == 'integer':
+        return rng.randint(-10000, 10000)
+    if t == 'number':
+        return round(rng.random() * 1000, 3)
+    return rng.random() < 0.5
+
+
+def rows(count, width, dirty=False, seed=1):
+    rng = random.Random(seed)
+    types = [it['type'] for it in schema(width)['items']['items']]
+    return [[value(t, n, rng, dirty) for t in types] for n in range(count)]
+
+
+def csv_body(count, width, dirty=False):
+    lines = [','.join('col_%d' % n for n in range(width))]
+    for row in rows(count, width, dirty):
+        lines.append(','.join(csv_value(v) for v in row))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def csv_value(v):
+    if isinstance(v, bool):
+        return 'true' if v else 'false'
+    return str(v)
+
+
+def json_body(count, width, dirty=False):
+    return json.dumps(rows(count, width, dirty)).encode('utf-8')
+
+
+def list_objs(count):
+    return [{
+        'username': 'peer_%d' % (n % 50),
+        'name': 'dataset_%d' % n,
+        'profileID': 'QmProfile%d' % n,
+        'path': '/ipfs/QmPath%d' % n,
+        'bodySize': 1024 * n,
+        'bodyRows': n,
+        'bodyFormat': 'csv',
+        'numErrors': 0,
+        'metaTitle': 'Dataset %d' % n,
+        'commitTime': '2020-08-24T20:00:32.171549113Z',
+    } for n in range(count)]
+
+
+README = '\n\n'.join(['# Heading %d\n\nSome *text* with a [link](http://qri.io) '
+                      'and `code`.\n\n- one\n- two\n- three' % n
+                      for n in range(50)])
@@ -0,0 +1,87 @@
+"""asyncio variants of the client API, for use inside an event loop"""
+
+import asyncio
+import functools
+
+from . import cmd_util, config, dataset, dsref, error, loader, sql_util
+
+
+async def list(username=None, offset=None, limit=None, term=None):
+    """list datasets in the user's repository. Filtering by username or
+       search term, and paging with offset and limit, are done by qri"""
+    try:
+        objs = await loader.acall('list_dataset_objects', username, offset,
+                                  limit, term)
+    except error.CloudMissingAPIError as e:
+        cmd_util.write_missing_cloud_api('list')
+        return None
+    datasets = dataset.DatasetList([dataset.Dataset(d) for d in objs])
+    datasets.sort(key=lambda d: d.human_ref())
+    return datasets
+
+
+async def get(refstr):
+    """get a dataset in the repository by reference"""
+    ref = dsref.parse_ref(refstr)
+    obj = await loader.acall('get_dataset_object', ref)
+    return dataset.Dataset(obj)
+
+
+async def get_many(refstrs, max_concurrency=config.DEFAULT_MAX_WORKERS,
+                   body=False):
+    """get many datasets concurrently, at most max_concurrency at a time,
+       optionally loading their bodies too. Refs that fail are left out of
+       the result, and their errors are collected in its `errors` dict,
+       keyed by reference"""
+    refstrs = [r for r in refstrs]
+    # Each fetch may start a qri process, so don't start them all at once
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(refstr):
+        async with semaphore:
+            d = await get(refstr)
+            if body:
+                await d.aload_body()
+            return d
+
+    results = await asyncio.gather(*[fetch(r) for r in refstrs],
+                                   return_exceptions=True)
+    datasets = dataset.DatasetList()
+    for refstr, result in zip(refstrs, results):
+        if isinstance(result, Exception):
+            datasets.errors[refstr] = result
+        else:
+            datasets.append(result)
+    return datasets
+
+
+async def pull(refstr):
+    """pull a remote dataset from the registry to the user's repository"""
+    ref = dsref.parse_ref(refstr)
+    try:
+        text = await loader.acall('pull_dataset', ref)
+    except error.CloudMissingAPIError as e:
+        cmd_util.write_missing_cloud_api('pull')
+        return None
+    print('Pulled %s: %s' % (ref, text))
+    return None
+
+
+async def sql(query, params=None, engine='auto'):
+    """sql query run against a dataset, with params bound to placeholders.
+       The engine is chosen as in qri.sql"""
+    sql_util.check_engine(engine)
+    query = sql_util.bind_params(query, params)
+    loop = asyncio.get_event_loop()
+    objs = await loop.run_in_executor(None, sql_util.referenced_objects,
+                                      query)
+    types = sql_util.result_types(objs)
+    result = await loop.run_in_executor(None, functools.partial(
+        sql_util.run_local, query, objs, types, engine=engine))
+    if result is not None:
+        return result
+    try:
+        return await loader.acall('sql', query, types)
+    except error.CloudMissingAPIError as e:
+        cmd_util.write_missing_cloud_api('sql')
+        return None
@@ -0,0 +1,791 @@
+"""Parsing of dataset bodies into pandas DataFrames"""
+
+import codecs
+from concurrent.futures import ProcessPoolExecutor
+import io
+import itertools
+import json
+import os
+import tempfile
+
+from . import error, instrument, util
+from .util import LazyModule
+
+
+pandas = LazyModule('pandas')
+
+
+DEFAULT_CHUNKSIZE = 10000
+
+SUPPORTED_FORMATS = ('csv', 'json', 'ndjson', 'parquet', 'arrow')
+
+JSON_BLOCKSIZE = 1 << 16
+
+# Bytes of csv handed to each process when parsing in parallel
+PARTITION_BYTES = 1 << 25
+
+BOOL_VALUES = {'true': True, 'false': False, '1': True, '0': False,
+               '1.0': True, '0.0': False}
+
+FALLBACKS_ATTR = 'qri_fallbacks'
+
+# Text that the csv parser reads as a boolean
+CSV_BOOL_VALUES = {'True': True, 'TRUE': True, 'true': True,
+                   'False': False, 'FALSE': False, 'false': False}
+
+
+def check_format(structure):
+    if structure.format not in SUPPORTED_FORMATS:
+        raise RuntimeError('Format "%s" not supported' % structure.format)
+
+
+def read(stream, structure, columns=None, nrows=None):
+    """Parse an entire body, using the decoder for structure.format. If
+       given, only the listed columns and the first nrows rows are kept"""
+    check_format(structure)
+    with instrument.span('parse', format=structure.format) as attrs:
+        if structure.format == 'parquet':
+            df = read_parquet(stream, columns, nrows)
+        elif structure.format == 'arrow':
+            df = read_arrow(stream, columns, nrows)
+        elif structure.format in ('json', 'ndjson'):
+            df = read_json(stream, structure, columns, nrows)
+        else:
+            df = read_csv(stream, structure, columns=columns, nrows=nrows)
+        attrs['rows'] = len(df)
+    return df
+
+
+def read_result_csv(stream, types=None):
+    """Parse a csv with a header row, such as a query result, typing the
+       columns that are named in types"""
+    types = types or {}
+    with instrument.span('parse', format='csv') as attrs:
+        df = apply_types(pandas.read_csv(stream, dtype=parse_dtypes(types)),
+                         types)
+        attrs['rows'] = len(df)
+    return df
+
+
+def iter_result_csv(stream, types=None, chunksize=DEFAULT_CHUNKSIZE):
+    types = types or {}
+    reader = pandas.read_csv(stream, dtype=parse_dtypes(types),
+                             chunksize=chunksize)
+    for chunk in reader:
+        yield apply_types(chunk, types)
+
+
+def check_columns(structure, columns):
+    """Raise an error if any of the columns are not in the schema"""
+    if columns is None:
+        return
+    if structure.format == 'csv':
+        names, _, _ = csv_options(structure)
+    else:
+        names, _ = schema_columns(structure)
+    if names is None:
+        # Nothing to check against, the body defines its own columns
+        return
+    unknown = [c for c in columns if c not in names]
+    if unknown:
+        raise error.QriClientError('Unknown columns: %s' %
+                                   ', '.join(map(str, unknown)))
+
+
+def iter_chunks(stream, structure, chunksize=DEFAULT_CHUNKSIZE):
+    """Parse a body incrementally, using the decoder for structure.format,
+       yielding DataFrames of at most chunksize rows"""
+    check_format(structure)
+    if structure.format == 'parquet':
+        return iter_parquet(stream, chunksize)
+    elif structure.format == 'arrow':
+        return iter_arrow(stream, chunksize)
+    elif structure.format in ('json', 'ndjson'):
+        return iter_json(stream, structure, chunksize)
+    return iter_csv(stream, structure, chunksize)
+
+
+def optional_pyarrow():
+    """Return the pyarrow module, or None if it isn't installed"""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def require_pyarrow(what):
+    pyarrow = optional_pyarrow()
+    if pyarrow is None:
+        raise error.QriClientError(
+            'pyarrow is required to load %s, install it with '
+            '`pip install qri[arrow]`' % what)
+    return pyarrow
+
+
+def read_parquet(stream, columns=None, nrows=None):
+    """Decode a parquet body. Parquet needs random access, so the stream
+       is read into memory and decoded from there without copying. Only
+       the requested columns are decoded"""
+    pyarrow = require_pyarrow('parquet bodies')
+    source = pyarrow.BufferReader(stream.read())
+    table = pyarrow.parquet.read_table(source, columns=columns)
+    if nrows is not None:
+        table = table.slice(0, nrows)
+    return from_arrow(table)
+
+
+def iter_parquet(stream, chunksize=DEFAULT_CHUNKSIZE):
+    pyarrow = require_pyarrow('parquet bodies')
+    source = pyarrow.BufferReader(stream.read())
+    batches = pyarrow.parquet.ParquetFile(source).iter_batches(
+        batch_size=chunksize)
+    return _rechunk_batches(batches, chunksize)
+
+
+def read_arrow(stream, columns=None, nrows=None):
+    """Decode a body in the Arrow IPC streaming format, straight from the
+       stream"""
+    pyarrow = require_pyarrow('arrow bodies')
+    table = pyarrow.ipc.open_stream(stream).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    if nrows is not None:
+        table = table.slice(0, nrows)
+    return from_arrow(table)
+
+
+def iter_arrow(stream, chunksize=DEFAULT_CHUNKSIZE):
+    pyarrow = require_pyarrow('arrow bodies')
+    return _rechunk_batches(pyarrow.ipc.open_stream(stream), chunksize)
+
+
+def from_arrow(table):
+    """Convert an arrow table or record batch to a DataFrame. Columnar
+       formats carry their own types, so nothing ever falls back"""
+    df = table.to_pandas()
+    df.attrs[FALLBACKS_ATTR] = {}
+    return df
+
+
+def _rechunk_batches(batches, chunksize):
+    rechunker = Rechunker(chunksize)
+    for batch in batches:
+        for chunk in rechunker.add(from_arrow(batch)):
+            yield chunk
+    for chunk in rechunker.finish():
+        yield chunk
+
+
+def pd_type(t):
+    if t == 'integer':
+        return 'Int64'
+    elif t == 'number':
+        return 'float64'
+    elif t == 'string':
+        return 'string'
+    elif t in ('bool', 'boolean'):
+        return 'boolean'
+    elif t in ('array', 'object'):
+        return 'object'
+    raise RuntimeError('Unknown type: "%s"' % t)
+
+
+def csv_options(structure):
+    """Return the column names, column types and header row to use when
+       parsing a csv body with the given structure"""
+    columns = [e for e in structure.schema['items']['items']]
+    col_names = [c['title'] for c in columns]
+    types = {c['title']: pd_type(c['type']) for c in columns}
+    format_config = structure.format_config or {}
+    header = 0 if format_config.get('headerRow') else None
+    return col_names, types, header
+
+
+def parse_dtypes(types):
+    """Types to give the csv parser directly. Text columns are kept as
+       text so that values like "007" aren't mangled, everything else is
+       inferred by the parser and coerced afterwards"""
+    return {name: object for name, t in types.items() if t == 'string'}
+
+
+def read_csv(stream, structure, continuation=False, columns=None,
+             nrows=None):
+    """Parse an entire csv body in a single pass, typed by the schema. A
+       continuation is a later piece of a body, so has no header row. Only
+       the requested columns and first nrows rows are parsed"""
+    col_names, types, header = csv_options(structure)
+    if continuation:
+        header = None
+    if columns is not None:
+        types = {k: v for k, v in types.items() if k in columns}
+    df = pandas.read_csv(stream, header=header, names=col_names,
+                         dtype=parse_dtypes(types), usecols=columns,
+                         nrows=nrows)
+    if columns is not None:
+        # Keep the order that was asked for
+        df = df[list(columns)]
+    return apply_types(df, types)
+
+
+def read_csv_parallel(stream, structure, workers, columns=None,
+                      partition_bytes=PARTITION_BYTES):
+    """Parse an entire csv body using a pool of processes. The stream is
+       split into partitions of about partition_bytes that end on row
+       boundaries, each partition is parsed and typed by the schema in a
+       worker, and the results are joined in order. Only a few partitions
+       are in flight at a time, so memory stays bounded. Partitions are
+       spilled to a temporary file that workers read them from, so that
+       columns which fell back can be parsed again as text in the same pool
+       without reading the body twice"""
+    col_names, types, header = csv_options(structure)
+    if columns is not None:
+        types = {k: v for k, v in types.items() if k in columns}
+    options = (col_names, types, columns)
+    spans = []
+    with instrument.span('parse', format='csv', workers=workers) as attrs, \
+            tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'body.csv')
+
+        def tasks(spill):
+            for start, length in _spill_partitions(stream, spill,
+                                                   partition_bytes):
+                first = header if not spans else None
+                spans.append((start, length, first))
+                yield path, start, length, first, options
+
+        with open(path, 'wb') as spill, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            frames = list(util.ordered_map(executor, _parse_partition,
+                                           tasks(spill), workers))
+            failed = list(merge_fallbacks(frames))
+            texts = []
+            for frame, (start, length, first) in zip(frames, spans):
+                if parsed_as_text(frame, failed):
+                    texts.append(frame[failed])
+                else:
+                    texts.append(executor.submit(
+                        _partition_text,
+                        (path, start, length, first, col_names, failed)))
+            texts = [t if isinstance(t, pandas.DataFrame) else t.result()
+                     for t in texts]
+        if frames:
+            df = concat(frames)
+            rebuild_fallbacks(df, texts, types)
+        else:
+            df = pandas.DataFrame(columns=columns or col_names)
+            df.attrs[FALLBACKS_ATTR] = {}
+        attrs['rows'] = len(df)
+    # Workers report fallbacks to their own listeners, so report them here
+    for name, failed in fallbacks(df).items():
+        instrument.emit('fallback', column=name, values=failed)
+    return df
+
+
+def parsed_as_text(frame, names):
+    """Whether the named columns of a piece were left as text by the
+       parser, which is how a single pass leaves a column that falls back"""
+    return all(pandas.api.types.is_object_dtype(frame[name]) or
+               pandas.api.types.is_string_dtype(frame[name])
+               for name in names)
+
+
+def read_text_columns(stream, structure, names, continuation=False):
+    """Parse the named columns of a csv body as text, before anything is
+       inferred or converted"""
+    col_names, _, header = csv_options(structure)
+    if continuation:
+        header = None
+    df = pandas.read_csv(stream, header=header, names=col_names,
+                         usecols=names, dtype=object)
+    return df[list(names)]
+
+
+def rebuild_fallbacks(df, texts, types):
+    """Set the columns of df that fell back the way a single pass over the
+       body would leave them. df was joined from pieces that were typed
+       separately, so such a column still holds converted values from the
+       pieces where it did convert. texts holds the text of those columns
+       for every piece, in order. The text is joined, inferred as the csv
+       parser would, and converted once"""
+    counts = {}
+    for name in fallbacks(df):
+        text = pandas.concat([t[name].astype(object) for t in texts],
+                             ignore_index=True)
+        numeric = pandas.to_numeric(text, errors='coerce')
+        bad = int((numeric.isna() & text.notna()).sum())
+        if not bad:
+            column = numeric
+        elif len(text) and text.isin(CSV_BOOL_VALUES).all():
+            column = text.map(CSV_BOOL_VALUES).astype(bool)
+        else:
+            column = text.infer_objects()
+        column.index = df.index
+        if bad and types[name] in ('Int64', 'float64'):
+            # Converting would fail on the same values again
+            converted, count = None, bad
+        else:
+            converted, count = coerce_column(column, types[name])
+        if count:
+            df[name] = column
+            counts[name] = count
+        else:
+            df[name] = converted
+    df.attrs[FALLBACKS_ATTR] = counts
+    return df
+
+
+def _spill_partitions(stream, spill, partition_bytes):
+    """Write a csv stream to spill a partition at a time, yielding the
+       (start, length) of each partition once it has been written. Each
+       partition ends on a row boundary"""
+    splitter = RowSplitter()
+    start = 0
+    while True:
+        data = stream.read(partition_bytes)
+        if not data:
+            rows = splitter.finish()
+            if not rows.strip():
+                return
+        else:
+            rows = splitter.feed(data)
+            if not rows:
+                continue
+        spill.write(rows)
+        spill.flush()
+        yield start, len(rows)
+        start += len(rows)
+        if not data:
+            return
+
+
+def _read_span(path, start, length):
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        return fp.read(length)
+
+
+def _parse_partition(args):
+    path, start, length, header, (col_names, types, columns) = args
+    data = _read_span(path, start, length)
+    df = pandas.read_csv(io.BytesIO(data), header=header, names=col_names,
+                         dtype=parse_dtypes(types), usecols=columns)
+    if columns is not None:
+        df = df[list(columns)]
+    return apply_types(df, types)
+
+
+def _partition_text(args):
+    path, start, length, header, col_names, names = args
+    data = _read_span(path, start, length)
+    df = pandas.read_csv(io.BytesIO(data), header=header, names=col_names,
+                         usecols=names, dtype=object)
+    return df[list(names)]
+
+
+def iter_csv(stream, structure, chunksize=DEFAULT_CHUNKSIZE):
+    """Parse a csv body incrementally, yielding DataFrames of at most
+       chunksize rows. The stream is only read once"""
+    col_names, types, header = csv_options(structure)
+    reader = pandas.read_csv(stream, header=header, names=col_names,
+                             dtype=parse_dtypes(types), chunksize=chunksize)
+    for chunk in reader:
+        yield apply_types(chunk, types)
+
+
+async def aiter_csv(blocks, structure, chunksize=DEFAULT_CHUNKSIZE):
+    """Parse a csv body from an async iterator of byte blocks, yielding
+       DataFrames of at most chunksize rows"""
+    splitter = RowSplitter()
+    rechunker = Rechunker(chunksize)
+    continuation = False
+    async for data in blocks:
+        rows = splitter.feed(data)
+        if not rows:
+            continue
+        df = read_csv(io.BytesIO(rows), structure, continuation)
+        continuation = True
+        for chunk in rechunker.add(df):
+            yield chunk
+    rows = splitter.finish()
+    if rows.strip():
+        df = read_csv(io.BytesIO(rows), structure, continuation)
+        for chunk in rechunker.add(df):
+            yield chunk
+    for chunk in rechunker.finish():
+        yield chunk
+
+
+def schema_columns(structure):
+    """Return the column names and types of a body, from a schema of
+       either an array of objects or an array of arrays. Names are None if
+       the schema doesn't list them"""
+    return columns_from_schema(structure.schema)
+
+
+def columns_from_schema(schema):
+    items = (schema or {}).get('items') or {}
+    if 'properties' in items:
+        columns = [(k, v.get('type')) for k, v in items['properties'].items()]
+    elif isinstance(items.get('items'), list):
+        columns = [(c.get('title'), c.get('type')) for c in items['items']]
+    else:
+        return None, {}
+    names = [name for name, _ in columns]
+    types = {}
+    for name, t in columns:
+        try:
+            types[name] = pd_type(t)
+        except RuntimeError:
+            pass
+    return names, types
+
+
+def read_json(stream, structure, columns=None, nrows=None):
+    """Parse an entire json or ndjson body, typed by the schema"""
+    frames = [f for f in iter_json(stream, structure, columns=columns,
+                                   nrows=nrows)]
+    if not frames:
+        names, _ = schema_columns(structure)
+        return pandas.DataFrame(columns=columns or names or [])
+    return concat(frames)
+
+
+def iter_json(stream, structure, chunksize=DEFAULT_CHUNKSIZE, columns=None,
+              nrows=None):
+    """Parse a json body (a top-level array) or an ndjson body (one value
+       per line) incrementally. Rows are collected into column buffers and
+       turned into a DataFrame every chunksize rows, so only one chunk of
+       python objects exists at a time. Only the requested columns and the
+       first nrows rows are collected"""
+    names, types = schema_columns(structure)
+    if structure.format == 'ndjson':
+        rows = iter_ndjson_values(stream)
+    else:
+        rows = iter_json_array(stream)
+    if nrows is not None:
+        rows = itertools.islice(rows, nrows)
+    offset = 0
+    selected = None
+    buffers = None
+    count = 0
+    for row in rows:
+        if selected is None:
+            if names is None:
+                names = list(row) if isinstance(row, dict) else \
+                    list(range(len(row)))
+            selected = [(i, name) for i, name in enumerate(names)
+                        if columns is None or name in columns]
+            if columns is not None:
+                order = {name: n for n, name in enumerate(columns)}
+                selected.sort(key=lambda s: order[s[1]])
+            buffers = {name: [] for _, name in selected}
+        if isinstance(row, dict):
+            for _, name in selected:
+                buffers[name].append(row.get(name))
+        else:
+            for i, name in selected:
+                buffers[name].append(row[i] if i < len(row) else None)
+        count += 1
+        if count == chunksize:
+            yield _json_chunk(buffers, types, offset, count)
+            offset += count
+            buffers = {name: [] for _, name in selected}
+            count = 0
+    if count:
+        yield _json_chunk(buffers, types, offset, count)
+
+
+def _json_chunk(columns, types, offset, count):
+    df = pandas.DataFrame(columns,
+                          index=pandas.RangeIndex(offset, offset + count))
+    return apply_types(df, types)
+
+
+def iter_ndjson_values(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_json_array(stream, blocksize=JSON_BLOCKSIZE):
+    """Yield each value of a top-level json array, reading the stream a
+       block at a time rather than decoding the whole document"""
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    buf = ''
+    pos = 0
+    eof = False
+    started = False
+
+    def more():
+        data = stream.read(blocksize)
+        if not data:
+            return buf[pos:] + text.decode(b'', final=True), True
+        return buf[pos:] + text.decode(data), False
+
+    while True:
+        # Skip whitespace and separators between values
+        while pos < len(buf) and buf[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                raise error.QriClientError('Unexpected end of json body')
+            buf, eof = more()
+            pos = 0
+            continue
+        if not started:
+            if buf[pos] != '[':
+                raise error.QriClientError('Expected json body to be an array')
+            started = True
+            pos += 1
+            continue
+        if buf[pos] == ']':
+            return
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            buf, eof = more()
+            pos = 0
+            continue
+        if end == len(buf) and not eof:
+            # The value may continue in the next block, like a number
+            buf, eof = more()
+            pos = 0
+            continue
+        yield value
+        pos = end
+
+
+def apply_types(df, types):
+    """Convert each column to its schema type. A column with any value
+       that can't be converted is left as parsed, and the number of bad
+       values is recorded in df.attrs under FALLBACKS_ATTR"""
+    fallbacks = {}
+    for name, t in types.items():
+        if name not in df.columns:
+            continue
+        converted, failed = coerce_column(df[name], t)
+        if failed:
+            fallbacks[name] = failed
+            instrument.emit('fallback', column=name, values=failed)
+        else:
+            df[name] = converted
+    df.attrs[FALLBACKS_ATTR] = fallbacks
+    return df
+
+
+def fallbacks(df):
+    """Columns of a parsed body that didn't match their schema type,
+       mapped to the number of values that failed to convert"""
+    attrs = getattr(df, 'attrs', None) or {}
+    return dict(attrs.get(FALLBACKS_ATTR, {}))
+
+
+def coerce_column(series, t):
+    """Return the column converted to the pandas type, and the number of
+       values that could not be converted"""
+    if t == 'object':
+        return series, 0
+    if t == 'string':
+        return series.astype('string'), 0
+    if t == 'boolean':
+        return _to_boolean(series)
+    numeric, failed = _to_numeric(series)
+    if failed:
+        return series, failed
+    if t == 'Int64':
+        fractional = numeric.notna() & (numeric % 1 != 0)
+        failed = int(fractional.sum())
+        if failed:
+            return series, failed
+    return numeric.astype(t), 0
+
+
+def _to_numeric(series):
+    if pandas.api.types.is_numeric_dtype(series.dtype):
+        return series, 0
+    numeric = pandas.to_numeric(series, errors='coerce')
+    failed = int((numeric.isna() & series.notna()).sum())
+    return numeric, failed
+
+
+def _to_boolean(series):
+    if pandas.api.types.is_bool_dtype(series.dtype):
+        return series.astype('boolean'), 0
+    present = series.notna()
+    mapped = series[present].astype(str).str.lower().map(BOOL_VALUES)
+    failed = int(mapped.isna().sum())
+    if failed:
+        return series, failed
+    result = pandas.Series(pandas.NA, index=series.index, dtype='boolean')
+    result[present] = mapped.astype(bool)
+    return result, 0
+
+
+def merge_fallbacks(frames):
+    """Combined fallbacks of several parsed pieces of one body"""
+    total = {}
+    for df in frames:
+        for name, failed in fallbacks(df).items():
+            total[name] = total.get(name, 0) + failed
+    return total
+
+
+def concat(frames):
+    """Join parsed pieces of a body into one DataFrame, in order"""
+    if len(frames) == 1:
+        df = frames[0]
+    else:
+        df = pandas.concat(frames, ignore_index=True)
+    df.attrs[FALLBACKS_ATTR] = merge_fallbacks(frames)
+    return df
+
+
+def comparable_columns(a, b):
+    """Return a and b with each column they share in the same dtype, so that
+       equal values hash the same. A column can be typed differently in two
+       versions, because the schema changed or because it fell back to text
+       in one of them. Such columns are compared as numbers if both convert
+       cleanly, and as text otherwise"""
+    a_cols = {}
+    b_cols = {}
+    for name in a.columns.intersection(b.columns):
+        x, y = a[name], b[name]
+        if x.dtype == y.dtype:
+            continue
+        x_num = pandas.to_numeric(x, errors='coerce')
+        y_num = pandas.to_numeric(y, errors='coerce')
+        if (x_num.isna() == x.isna()).all() and \
+                (y_num.isna() == y.isna()).all():
+            a_cols[name] = x_num.astype('float64')
+            b_cols[name] = y_num.astype('float64')
+        else:
+            a_cols[name] = _as_text(x)
+            b_cols[name] = _as_text(y)
+    if a_cols:
+        a = a.copy(deep=False)
+        b = b.copy(deep=False)
+        for name in a_cols:
+            a[name] = a_cols[name]
+            b[name] = b_cols[name]
+    return a, b
+
+
+def _as_text(series):
+    present = series.notna()
+    text = pandas.Series(None, index=series.index, dtype=object)
+    text[present] = series[present].astype(str).astype(object)
+    return text
+
+
+def row_keys(df):
+    """A key per row that is equal for equal rows. Repeated rows are told
+       apart by how many times they occurred before"""
+    hashes = pandas.util.hash_pandas_object(df, index=False)
+    counts = hashes.groupby(hashes.values).cumcount()
+    return pandas.MultiIndex.from_arrays([hashes.values, counts.values])
+
+
+def diff_rows(old, new):
+    """Return (added, removed): the rows of new that aren't in old, and the
+       rows of old that aren't in new. Rows are compared by hash, so each
+       body is only read once"""
+    old_keys, new_keys = map(row_keys, comparable_columns(old, new))
+    added = new[~new_keys.isin(old_keys)]
+    removed = old[~old_keys.isin(new_keys)]
+    return added, removed
+
+
+class RowSplitter(object):
+    """Splits a stream of csv bytes into pieces that end on row boundaries.
+       Quotes are tracked, so a newline inside a quoted value doesn't end a
+       row"""
+    def __init__(self):
+        self.buf = b''
+        self.in_quotes = False
+
+    def feed(self, data):
+        """Add more bytes, return whatever complete rows are available"""
+        self.buf += data
+        end, in_quotes = find_row_end(self.buf, self.in_quotes)
+        if end == -1:
+            return b''
+        rows = self.buf[:end]
+        self.buf = self.buf[end:]
+        # A row boundary is always outside of quotes
+        self.in_quotes = False
+        return rows
+
+    def finish(self):
+        """Return the remaining bytes, once the stream has ended"""
+        rows = self.buf
+        self.buf = b''
+        return rows
+
+
+def find_row_end(data, in_quotes=False):
+    """Return the position just past the last newline in data that is
+       outside of quotes (or -1 if there is none), and whether the end of
+       the data is inside quotes"""
+    if not in_quotes and b'"' not in data:
+        pos = data.rfind(b'\n')
+        return (pos + 1 if pos != -1 else -1), False
+    last = -1
+    pos = 0
+    parts = data.split(b'"')
+    for i, part in enumerate(parts):
+        if not in_quotes:
+            nl = part.rfind(b'\n')
+            if nl != -1:
+                last = pos + nl + 1
+        pos += len(part) + 1
+        if i < len(parts) - 1:
+            in_quotes = not in_quotes
+    return last, in_quotes
+
+
+class Rechunker(object):
+    """Collects parsed pieces of any size and hands them back as DataFrames
+       of chunksize rows, with an index that continues across chunks"""
+    def __init__(self, chunksize=DEFAULT_CHUNKSIZE):
+        self.chunksize = chunksize
+        self.pending = []
+        self.count = 0
+        self.offset = 0
+
+    def add(self, df):
+        """Add a piece, return a list of any chunks that are now full"""
+        self.pending.append(df)
+        self.count += len(df)
+        result = []
+        while self.count >= self.chunksize:
+            df = concat(self.pending)
+            chunk = df.iloc[:self.chunksize].copy()
+            rest = df.iloc[self.chunksize:].copy()
+            # Fallbacks are counted once, against the chunk being emitted
+            rest.attrs = {FALLBACKS_ATTR: {}}
+            result.append(self._emit(chunk))
+            self.pending = [rest] if len(rest) else []
+            self.count = len(rest)
+        return result
+
+    def finish(self):
+        """Return the final, partial chunk if there is one"""
+        if not self.count:
+            return []
+        chunk = concat(self.pending)
+        self.pending = []
+        self.count = 0
+        return [self._emit(chunk)]
+
+    def _emit(self, chunk):
+        fallbacks = chunk.attrs.get(FALLBACKS_ATTR, {})
+        chunk.index = pandas.RangeIndex(self.offset, self.offset + len(chunk))
+        chunk.attrs[FALLBACKS_ATTR] = fallbacks
+        self.offset += len(chunk)
+        return chunk
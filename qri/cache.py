@@ -0,0 +1,242 @@
+"""Content-addressed on-disk cache of parsed dataset bodies"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+
+from . import body, config, instrument
+from .util import LazyModule
+
+
+pandas = LazyModule('pandas')
+
+
+PICKLE_SUFFIX = '.pkl'
+ARROW_SUFFIX = '.arrow'
+SUFFIXES = (ARROW_SUFFIX, PICKLE_SUFFIX)
+MAX_NAME_LEN = 100
+FALLBACKS_KEY = b'qri_fallbacks'
+
+
+_inst = None
+
+
+def instance():
+    global _inst
+    if _inst is None:
+        if config.cache_enabled():
+            _inst = BodyCache(config.cache_dir(), config.cache_max_bytes())
+        else:
+            _inst = NullCache()
+    return _inst
+
+
+def set_instance(obj):
+    global _inst
+    _inst = obj
+
+
+def info():
+    """summary of what is stored in the body cache"""
+    return instance().info()
+
+
+def clear():
+    """remove every entry from the body cache"""
+    instance().clear()
+
+
+def entry_name(key, suffix=PICKLE_SUFFIX):
+    """Return the filename used to store the given key. Content addresses
+       are kept readable, anything long or unusual is hashed so that
+       different keys never share a file"""
+    if re.match(r'^/?[A-Za-z0-9.-]+(/[A-Za-z0-9.-]+)*$', key) and \
+            len(key) <= MAX_NAME_LEN:
+        return key.lstrip('/').replace('/', '_') + suffix
+    return hashlib.sha1(key.encode('utf-8')).hexdigest() + suffix
+
+
+def partial_key(path, columns=None, limit=None, offset=None):
+    """Key for part of a body, so that it is cached separately from the
+       full body at the same path"""
+    parts = []
+    if columns is not None:
+        parts.append('columns=%s' % json.dumps(list(map(str, columns))))
+    if limit is not None:
+        parts.append('limit=%d' % limit)
+    if offset is not None:
+        parts.append('offset=%d' % offset)
+    return '%s?%s' % (path, '&'.join(parts))
+
+
+def write_arrow(df, filename):
+    """Write a DataFrame as an Arrow IPC file, which can later be memory
+       mapped instead of read and unpickled"""
+    pyarrow = body.optional_pyarrow()
+    table = pyarrow.Table.from_pandas(df)
+    metadata = dict(table.schema.metadata or {})
+    metadata[FALLBACKS_KEY] = json.dumps(body.fallbacks(df)).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+    with pyarrow.OSFile(filename, 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def read_arrow(filename):
+    pyarrow = body.optional_pyarrow()
+    with pyarrow.memory_map(filename) as source:
+        table = pyarrow.ipc.open_file(source).read_all()
+    df = table.to_pandas()
+    metadata = table.schema.metadata or {}
+    df.attrs[body.FALLBACKS_ATTR] = json.loads(
+        metadata.get(FALLBACKS_KEY, b'{}'))
+    return df
+
+
+class BodyCache(object):
+    """Stores parsed bodies keyed by immutable content address. Entries
+       are evicted least-recently-used first once max_bytes is exceeded"""
+    def __init__(self, directory, max_bytes=config.DEFAULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _filename(self, key, suffix=PICKLE_SUFFIX):
+        return os.path.join(self.directory, entry_name(key, suffix))
+
+    def _find(self, key):
+        for suffix in SUFFIXES:
+            filename = self._filename(key, suffix)
+            if os.path.exists(filename):
+                return filename
+        return None
+
+    def get(self, key):
+        filename = self._find(key)
+        if filename is None:
+            instrument.emit('cache.miss')
+            return None
+        try:
+            with instrument.span('cache.hit'):
+                if filename.endswith(ARROW_SUFFIX):
+                    value = read_arrow(filename)
+                else:
+                    value = pandas.read_pickle(filename)
+        except Exception:
+            # Corrupt or unreadable entry, treat as a miss
+            self._remove_file(filename)
+            instrument.emit('cache.miss')
+            return None
+        # Touch the entry so that eviction is least-recently-used
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        # DataFrames are stored in the Arrow format if pyarrow is installed
+        # and the frame can be represented, anything else is pickled
+        if (isinstance(value, pandas.DataFrame) and
+                body.optional_pyarrow() is not None):
+            if self._write(key, value, ARROW_SUFFIX, write_arrow):
+                return True
+        return self._write(key, value, PICKLE_SUFFIX, pandas.to_pickle)
+
+    def _write(self, key, value, suffix, write):
+        tmp = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            os.close(fd)
+            write(value, tmp)
+            self.remove(key)
+            os.replace(tmp, self._filename(key, suffix))
+        except Exception:
+            # Caching is best effort, never fail a load because of it
+            self._remove_file(tmp)
+            return False
+        self.evict()
+        return True
+
+    def contains(self, key):
+        return self._find(key) is not None
+
+    def remove(self, key):
+        for suffix in SUFFIXES:
+            self._remove_file(self._filename(key, suffix))
+
+    def entries(self):
+        """list of (filename, size, mtime), oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        result = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIXES):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            result.append((name, st.st_size, st.st_mtime))
+        result.sort(key=lambda e: e[2])
+        return result
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        for name, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            self._remove_file(os.path.join(self.directory, name))
+            total -= size
+
+    def clear(self):
+        for name, _, _ in self.entries():
+            self._remove_file(os.path.join(self.directory, name))
+
+    def info(self):
+        entries = self.entries()
+        return {
+            'directory': self.directory,
+            'entries': len(entries),
+            'size': sum(e[1] for e in entries),
+            'max_size': self.max_bytes,
+        }
+
+    def _remove_file(self, filename):
+        if not filename:
+            return
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+class NullCache(object):
+    """Used when caching is disabled, never stores anything"""
+    def get(self, key):
+        return None
+
+    def put(self, key, value):
+        return False
+
+    def contains(self, key):
+        return False
+
+    def remove(self, key):
+        pass
+
+    def entries(self):
+        return []
+
+    def evict(self):
+        pass
+
+    def clear(self):
+        pass
+
+    def info(self):
+        return {'directory': None, 'entries': 0, 'size': 0, 'max_size': 0}
@@ -2,13 +2,22 @@
 
 """Client for interacting with qri repositories"""
 
-from . import cmd_util, dataset, dsref, error, loader
+from concurrent.futures import ThreadPoolExecutor
 
+from . import aio, cmd_util, config, dataset, dsref, error, instrument, loader
+from . import sql_util
+from .body import DEFAULT_CHUNKSIZE
 
-def list(username=None):
-    """list datasets in the user's repository"""
+
+DEFAULT_PAGE_SIZE = 100
+
+
+def list(username=None, offset=None, limit=None, term=None):
+    """list datasets in the user's repository. Filtering by username or
+       search term, and paging with offset and limit, are done by qri"""
     try:
-        objs = loader.instance().list_dataset_objects(username)
+        objs = loader.instance().list_dataset_objects(username, offset,
+                                                      limit, term)
     except error.CloudMissingAPIError as e:
         cmd_util.write_missing_cloud_api('list')
         return None
@@ -17,6 +26,20 @@ def list(username=None):
     return datasets
 
 
+def list_pages(username=None, term=None, page_size=DEFAULT_PAGE_SIZE):
+    """iterate over the user's repository one page of datasets at a time,
+       each page being fetched only once it is reached"""
+    offset = 0
+    while True:
+        page = list(username, offset, page_size, term)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        offset += page_size
+
+
 def get(refstr):
     """get a dataset in the repository by reference"""
     ref = dsref.parse_ref(refstr)
@@ -25,6 +48,31 @@ def get(refstr):
     return d
 
 
+def get_many(refstrs, max_workers=config.DEFAULT_MAX_WORKERS, body=False):
+    """get many datasets concurrently, optionally loading their bodies too.
+       Refs that fail are left out of the result, and their errors are
+       collected in its `errors` dict, keyed by reference"""
+    refstrs = [r for r in refstrs]
+    # Pick the backend once, before any worker threads use it
+    loader.instance()
+
+    def fetch(refstr):
+        d = get(refstr)
+        if body:
+            d.body
+        return d
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(r, pool.submit(fetch, r)) for r in refstrs]
+    datasets = dataset.DatasetList()
+    for refstr, future in futures:
+        try:
+            datasets.append(future.result())
+        except Exception as e:
+            datasets.errors[refstr] = e
+    return datasets
+
+
 def pull(refstr):
     """pull a remote dataset from the registry to the user's repository"""
     ref = dsref.parse_ref(refstr)
@@ -43,10 +91,26 @@ def add(refstr):
     return pull(refstr)
 
 
-def sql(query):
-    """sql query run against a dataset"""
-    cmd = ['qri', 'sql', '--format', 'json', query]
-    result, err = cmd_util.shell_exec(cmd)
-    if err:
-        raise error.QriClientError(err)
-    return loader.from_json(result)
+def sql(query, params=None, stream=False, chunksize=DEFAULT_CHUNKSIZE,
+        engine='auto'):
+    """sql query run against a dataset. Values in params are bound to "?"
+       (for a list) or ":name" (for a dict) placeholders. The result is typed
+       by the schemas of the datasets used. With stream set, an iterator of
+       DataFrames of at most chunksize rows is returned instead. The engine
+       is "local" to query loaded or cached bodies in-process, "qri" to
+       always use qri, or "auto" to pick local when it can"""
+    try:
+        return sql_util.run(query, params, stream, chunksize, engine)
+    except error.CloudMissingAPIError as e:
+        cmd_util.write_missing_cloud_api('sql')
+        return None
+
+
+def stats(reset=False):
+    """timings and counts of backend calls, parsing and caching so far,
+       keyed by event name: "shell", "http", "parse", "cache.hit",
+       "cache.miss", "metadata.hit", "metadata.miss" and "fallback"."""
+    result = instrument.stats()
+    if reset:
+        instrument.reset_stats()
+    return result
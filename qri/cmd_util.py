@@ -1,7 +1,20 @@
+import asyncio
+import contextlib
+import io
+import os
 import shlex
-from subprocess import Popen, PIPE
+from subprocess import DEVNULL, Popen, PIPE, TimeoutExpired
 import sys
-from . import util
+import tempfile
+import time
+from . import error, instrument, util
+
+
+STREAM_BLOCKSIZE = 1 << 20
+
+# Seconds to wait for a process to exit after its output couldn't be used,
+# to find out whether the process itself failed
+EXIT_TIMEOUT = 5.0
 
 
 def shell_exec(command, cwd=None):
@@ -10,13 +23,13 @@ def shell_exec(command, cwd=None):
         command_list = command
     else:
         command_list = shlex.split(command)
+    name = command_name(command_list)
     try:
-        proc = Popen(command_list,
-                     stdin=PIPE,
-                     stdout=PIPE,
-                     stderr=PIPE,
+        proc = spawn(command_list, name, stdin=PIPE, stdout=PIPE, stderr=PIPE,
                      cwd=cwd)
-        stdout, err = proc.communicate()
+        with instrument.span('shell', command=name) as attrs:
+            stdout, err = proc.communicate()
+            attrs['bytes'] = len(stdout)
         if proc.returncode == 0:
             # If command exit code is 0, assume stderr is informational only.
             # This probably won't work forever, but fits most of our current
@@ -30,6 +43,165 @@ def shell_exec(command, cwd=None):
         raise e
 
 
+def spawn(command_list, name, **kwargs):
+    """Start a process, timing how long that takes as a shell.spawn event"""
+    with instrument.span('shell.spawn', command=name):
+        return Popen(command_list, **kwargs)
+
+
+class CountingReader(io.RawIOBase):
+    """Reads a process's stdout, counting the bytes and the time spent
+       waiting for them, so that the transfer is measured apart from the
+       work of whatever consumes the stream"""
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        began = time.perf_counter()
+        n = self.raw.readinto(b)
+        self.seconds += time.perf_counter() - began
+        self.bytes += n or 0
+        return n
+
+
+@contextlib.contextmanager
+def shell_stream(command, cwd=None):
+    """execute commands and provide stdout as a binary stream, without
+       buffering the entire output in memory. The shell event covers only
+       the time spent waiting for output, not the time the consumer takes"""
+    if isinstance(command, list):
+        command_list = command
+    else:
+        command_list = shlex.split(command)
+    name = command_name(command_list)
+    # Send stderr to a file so that a chatty process can't block on a
+    # full pipe while stdout is still being consumed
+    with tempfile.TemporaryFile() as err_file:
+        try:
+            proc = spawn(command_list, name, stdin=DEVNULL, stdout=PIPE,
+                         stderr=err_file, cwd=cwd)
+        except FileNotFoundError:
+            write_missing_binary_error()
+            sys.exit(1)
+        start = time.time()
+        reader = CountingReader(proc.stdout)
+        try:
+            yield io.BufferedReader(reader)
+        except Exception as e:
+            # Output that couldn't be parsed is usually a failed command,
+            # in which case qri's error is the one worth reporting
+            proc.stdout.close()
+            try:
+                code = proc.wait(EXIT_TIMEOUT)
+            except TimeoutExpired:
+                proc.kill()
+                raise e
+            if code > 0:
+                err_file.seek(0)
+                raise error.QriClientError(err_file.read()) from e
+            raise
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            began = time.perf_counter()
+            code = proc.wait()
+            reader.seconds += time.perf_counter() - began
+            instrument.emit('shell', reader.seconds, start, command=name,
+                            bytes=reader.bytes)
+        if code != 0:
+            err_file.seek(0)
+            raise error.QriClientError(err_file.read())
+
+
+async def ashell_exec(command, cwd=None):
+    """execute commands without blocking the event loop, return stdout"""
+    proc = await _create_subprocess(command, cwd, PIPE)
+    with instrument.span('shell', command=command_name(command)) as attrs:
+        stdout, err = await proc.communicate()
+        attrs['bytes'] = len(stdout)
+    if proc.returncode == 0:
+        # As with shell_exec, stderr is informational if the command worked
+        err = None
+    return util.ensure_string(stdout), err
+
+
+async def ashell_stream(command, cwd=None, blocksize=STREAM_BLOCKSIZE):
+    """execute commands without blocking the event loop, yield blocks of
+       stdout as they arrive. As with shell_stream, the shell event only
+       covers the time spent waiting for output"""
+    with tempfile.TemporaryFile() as err_file:
+        proc = await _create_subprocess(command, cwd, err_file)
+        start = time.time()
+        seconds = 0.0
+        count = 0
+        try:
+            while True:
+                began = time.perf_counter()
+                data = await proc.stdout.read(blocksize)
+                seconds += time.perf_counter() - began
+                if not data:
+                    break
+                count += len(data)
+                yield data
+        except Exception as e:
+            # As with shell_stream, report qri's error if the command failed
+            try:
+                code = await asyncio.wait_for(proc.wait(), EXIT_TIMEOUT)
+            except asyncio.TimeoutError:
+                proc.kill()
+                raise e
+            if code > 0:
+                err_file.seek(0)
+                raise error.QriClientError(err_file.read()) from e
+            raise
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            began = time.perf_counter()
+            code = await proc.wait()
+            seconds += time.perf_counter() - began
+            instrument.emit('shell', seconds, start,
+                            command=command_name(command), bytes=count)
+        if code != 0:
+            err_file.seek(0)
+            raise error.QriClientError(err_file.read())
+
+
+async def _create_subprocess(command, cwd, stderr):
+    if isinstance(command, list):
+        command_list = command
+    else:
+        command_list = shlex.split(command)
+    name = command_name(command_list)
+    try:
+        with instrument.span('shell.spawn', command=name):
+            return await asyncio.create_subprocess_exec(*command_list,
+                                                        stdin=DEVNULL,
+                                                        stdout=PIPE,
+                                                        stderr=stderr,
+                                                        cwd=cwd)
+    except FileNotFoundError:
+        write_missing_binary_error()
+        sys.exit(1)
+
+
+def command_name(command):
+    """The program and subcommand, such as "qri get", used to label events"""
+    if not isinstance(command, list):
+        command = shlex.split(command)
+    if not command:
+        return ''
+    return ' '.join([os.path.basename(command[0])] + command[1:2])
+
+
 def write_missing_binary_error():
     sys.stderr.write("""qri command-line binary not found. It is either not installed, or PATH needs to be assigned. Please get the latest release from https://github.com/qri-io/qri, then run this command again.\n""")
 
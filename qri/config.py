@@ -0,0 +1,173 @@
+"""Settings for the qri client, read from the environment"""
+
+import os
+
+
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_API_URL = 'http://localhost:2503'
+DEFAULT_CLOUD_URL = 'https://api.qri.cloud'
+DEFAULT_METADATA_TTL = 10.0
+DEFAULT_METADATA_MAX_ENTRIES = 1024
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_BACKEND = 'auto'
+DEFAULT_BACKEND_TTL = 300.0
+DEFAULT_HTTP_CONNECT_TIMEOUT = 5.0
+DEFAULT_HTTP_READ_TIMEOUT = 60.0
+DEFAULT_HTTP_RETRIES = 3
+DEFAULT_HTTP_BACKOFF = 0.5
+DEFAULT_DOWNLOAD_PAGE_ROWS = 100000
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_LOCAL_SQL_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_PARALLEL_PARSE_BYTES = 256 * 1024 * 1024
+
+
+def cache_dir():
+    """directory where dataset bodies are cached"""
+    path = os.environ.get('QRI_PYTHON_CACHE_DIR')
+    if path:
+        return path
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'qri-python')
+
+
+def cache_max_bytes():
+    """upper bound on the size of the body cache, in bytes"""
+    val = os.environ.get('QRI_PYTHON_CACHE_MAX_BYTES')
+    if val:
+        return int(val)
+    return DEFAULT_CACHE_MAX_BYTES
+
+
+def cache_enabled():
+    """whether dataset bodies are cached on disk"""
+    val = os.environ.get('QRI_PYTHON_CACHE', '1')
+    return val.lower() not in ('0', 'false', 'no', 'off')
+
+
+def api_url():
+    """base url of a locally running qri API server (`qri connect`)"""
+    return os.environ.get('QRI_API_URL') or DEFAULT_API_URL
+
+
+def cloud_url():
+    """base url of the qri cloud API"""
+    return os.environ.get('QRI_CLOUD_URL') or DEFAULT_CLOUD_URL
+
+
+def metadata_ttl():
+    """seconds that dataset metadata is memoized for, 0 to disable"""
+    val = os.environ.get('QRI_PYTHON_METADATA_TTL')
+    if val:
+        return float(val)
+    return DEFAULT_METADATA_TTL
+
+
+def metadata_max_entries():
+    """maximum number of dataset objects that are memoized"""
+    val = os.environ.get('QRI_PYTHON_METADATA_MAX_ENTRIES')
+    if val:
+        return int(val)
+    return DEFAULT_METADATA_MAX_ENTRIES
+
+
+def backend():
+    """which backend to use: "api" for a local qri API server, "binary" for
+       the qri command-line binary, "cloud" for qri cloud, or "auto" to pick
+       the best one available"""
+    return (os.environ.get('QRI_BACKEND') or DEFAULT_BACKEND).lower()
+
+
+def qri_binary():
+    """path to the qri binary, if it isn't to be found on PATH"""
+    return os.environ.get('QRI_BINARY') or None
+
+
+def backend_ttl():
+    """seconds that an automatically detected backend is remembered across
+       processes, 0 to detect it every time"""
+    val = os.environ.get('QRI_PYTHON_BACKEND_TTL')
+    if val:
+        return float(val)
+    return DEFAULT_BACKEND_TTL
+
+
+def backend_state_file():
+    """file where the detected backend is remembered"""
+    return os.path.join(cache_dir(), 'backend.json')
+
+
+def http_connect_timeout():
+    """seconds to wait for a connection to a qri API server"""
+    val = os.environ.get('QRI_PYTHON_HTTP_CONNECT_TIMEOUT')
+    if val:
+        return float(val)
+    return DEFAULT_HTTP_CONNECT_TIMEOUT
+
+
+def http_read_timeout():
+    """seconds to wait for a qri API server to send data"""
+    val = os.environ.get('QRI_PYTHON_HTTP_READ_TIMEOUT')
+    if val:
+        return float(val)
+    return DEFAULT_HTTP_READ_TIMEOUT
+
+
+def http_retries():
+    """number of times a failed http request is retried"""
+    val = os.environ.get('QRI_PYTHON_HTTP_RETRIES')
+    if val:
+        return int(val)
+    return DEFAULT_HTTP_RETRIES
+
+
+def http_backoff():
+    """backoff factor between retries, they wait backoff * 2**n seconds"""
+    val = os.environ.get('QRI_PYTHON_HTTP_BACKOFF')
+    if val:
+        return float(val)
+    return DEFAULT_HTTP_BACKOFF
+
+
+def local_sql_max_bytes():
+    """bytes of bodies kept in the in-process sql database before the least
+       recently queried are dropped"""
+    val = os.environ.get('QRI_PYTHON_LOCAL_SQL_MAX_BYTES')
+    if val:
+        return int(val)
+    return DEFAULT_LOCAL_SQL_MAX_BYTES
+
+
+def download_page_rows():
+    """rows per page when a large body is downloaded from qri cloud in
+       parallel, 0 to always download in one request"""
+    val = os.environ.get('QRI_PYTHON_DOWNLOAD_PAGE_ROWS')
+    if val:
+        return int(val)
+    return DEFAULT_DOWNLOAD_PAGE_ROWS
+
+
+def download_workers():
+    """number of pages of a body that are downloaded at the same time"""
+    val = os.environ.get('QRI_PYTHON_DOWNLOAD_WORKERS')
+    if val:
+        return int(val)
+    return DEFAULT_DOWNLOAD_WORKERS
+
+
+def parallel_parse_bytes():
+    """size in bytes above which a local csv body is parsed by several
+       processes, 0 to always parse it in one"""
+    val = os.environ.get('QRI_PYTHON_PARALLEL_PARSE_BYTES')
+    if val:
+        return int(val)
+    return DEFAULT_PARALLEL_PARSE_BYTES
+
+
+def parse_workers():
+    """number of processes that parse a large csv body, by default one per
+       cpu"""
+    val = os.environ.get('QRI_PYTHON_PARSE_WORKERS')
+    if val:
+        return int(val)
+    return os.cpu_count() or 1
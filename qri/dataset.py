@@ -1,22 +1,33 @@
 import collections
-import markdown
+from concurrent.futures import ThreadPoolExecutor
 
+from . import body as body_parser
+from . import cache
+from . import config
 from . import dsref
+from . import error
 from . import loader
+from . import sql_util
 from . import version_info
-from .util import set_fields, build_repr, ensure_string, max_len
+from .body import DEFAULT_CHUNKSIZE
+from .util import Component, LazyModule, build_repr, ensure_string, \
+    field_map, max_len
+
+
+markdown = LazyModule('markdown')
+pandas = LazyModule('pandas')
 
 
 NO_META_TITLE = '(untitled dataset)'
 
+BodyDiff = collections.namedtuple('BodyDiff', ['added', 'removed'])
 
-class Meta(object):
-    def __init__(self, obj):
-        set_fields(self, obj, ['accessURL', 'accrualPeriodicity', 'citations',
-                               'contributors', 'description', 'downloadURL',
-                               'homeURL', 'identifier', 'keywords', 'language',
-                               'license', 'path' 'readmeURL', 'title', 'theme',
-                               'version'])
+
+class Meta(Component):
+    FIELDS = ['accessURL', 'accrualPeriodicity', 'citations', 'contributors',
+              'description', 'downloadURL', 'homeURL', 'identifier',
+              'keywords', 'language', 'license', 'path', 'readmeURL', 'title',
+              'theme', 'version']
 
     def __repr__(self):
         r = build_repr(self)
@@ -24,6 +35,8 @@ class Meta(object):
 
 
 class Readme(object):
+    __slots__ = ('script',)
+
     def __init__(self, obj):
         # TODO(dustmop): Handle scriptPath
         if not obj or 'scriptBytes' not in obj:
@@ -51,10 +64,9 @@ class Readme(object):
         return self.render()
 
 
-class Structure(object):
-    def __init__(self, obj):
-        set_fields(self, obj, ['checksum', 'depth', 'entries', 'format',
-                               'formatConfig', 'length', 'schema'])
+class Structure(Component):
+    FIELDS = ['checksum', 'depth', 'entries', 'format', 'formatConfig',
+              'length', 'schema']
 
     def __repr__(self):
         r = build_repr(self)
@@ -76,57 +88,83 @@ class Structure(object):
         return text
 
 
-class Commit(object):
-    def __init__(self, obj):
-        set_fields(self, obj, ['author', 'message', 'path', 'signature',
-                               'timestamp', 'title'])
+class Commit(Component):
+    FIELDS = ['author', 'message', 'path', 'signature', 'timestamp', 'title']
 
     def __repr__(self):
         r = build_repr(self)
         return 'Commit(%s)' % r
 
 
+SHORT_INFO_FIELDS = frozenset(['bodySize', 'bodyRows', 'bodyFormat',
+                               'numErrors', 'metaTitle', 'commitTime'])
+
+
 def is_short_info(obj):
     """Return whether the object is a short representation of a dataset"""
-    fields = ['bodySize', 'bodyRows', 'bodyFormat', 'numErrors', 'metaTitle',
-              'commitTime']
-    return bool(set(obj) & set(fields))
+    return not SHORT_INFO_FIELDS.isdisjoint(obj)
 
 
 class Dataset(object):
+    __slots__ = ('username', 'name', 'profile_id', 'path', '_info',
+                 '_is_populated', '_version', '_raw', 'body_path_value',
+                 'previous_path_value', 'body_component', 'commit_component',
+                 'meta_component', 'readme_component', 'structure_component')
+
+    _field_map = field_map(('username', 'name', 'profileID', 'path'))
+    _fields = [attr for _, attr in _field_map]
+
     def __init__(self, obj):
         # Fields that are always present
-        set_fields(self, obj, ['username', 'name', 'profileID', 'path'])
+        for key, name in self._field_map:
+            setattr(self, name, obj.get(key))
         if self.username is None and 'peername' in obj:
             self.username = obj.get('peername')
 
         self._info = None
         self._is_populated = False
+        self._version = None
 
         if is_short_info(obj):
             self._info = version_info.VersionInfo(obj)
         else:
             self._populate(obj)
 
+    def _ref(self):
+        return dsref.Ref(self.username, self.name, self._version)
+
     def _ensure_populated(self):
         if self._is_populated:
             return
-        ref = dsref.Ref(self.username, self.name)
+        ref = self._ref()
         self._populate(loader.instance().get_dataset_object(ref))
 
+    async def _aensure_populated(self):
+        if self._is_populated:
+            return
+        ref = self._ref()
+        self._populate(await loader.acall('get_dataset_object', ref))
+
     def _populate(self, obj):
         self.body_path_value = obj.get('bodyPath')
         self.previous_path_value = obj.get('previousPath')
 
-        # Subcomponents
-        self.commit_component = Commit(obj.get('commit'))
-        self.meta_component = Meta(obj.get('meta'))
-        self.readme_component = Readme(obj.get('readme'))
-        self.structure_component = Structure(obj.get('structure'))
+        # Subcomponents are decoded from the raw object when first used
+        self._raw = obj
         self.body_component = None
 
         self._is_populated = True
 
+    def __getattr__(self, name):
+        # Only called for attributes that haven't been set yet
+        lazy = LAZY_COMPONENTS.get(name)
+        if lazy is None or not self._is_populated:
+            raise AttributeError(name)
+        key, cls = lazy
+        component = cls(self._raw.get(key))
+        setattr(self, name, component)
+        return component
+
     @property
     def body_path(self):
         self._ensure_populated()
@@ -148,6 +186,14 @@ class Dataset(object):
             return self._info.meta_title
         return self.meta.title
 
+    def _known_meta_title(self):
+        """The meta title if it is already known, never fetches"""
+        if self._info:
+            return self._info.meta_title
+        if self._is_populated:
+            return self.meta_component.title
+        return None
+
     @property
     def commit(self):
         self._ensure_populated()
@@ -166,14 +212,164 @@ class Dataset(object):
     @property
     def body(self):
         self._ensure_populated()
-        if self.structure.format != 'csv':
-            raise RuntimeError('Only csv body format is supported')
+        body_parser.check_format(self.structure)
+        if self.body_component is None:
+            self.body_component = self._load_body()
+        return self.body_component
+
+    @property
+    def body_fallbacks(self):
+        """Columns of the body that didn't match their schema type, mapped
+           to the number of values that failed to convert. These columns
+           are left as parsed instead of typed"""
+        return body_parser.fallbacks(self.body)
+
+    def load_body(self, columns=None, limit=None, offset=None):
+        """Load part of the body: only the listed columns, and at most limit
+           rows starting from offset. Paging is done by qri, and only the
+           listed columns are parsed. Partial bodies are cached separately
+           from the full body"""
+        if columns is None and limit is None and offset is None:
+            return self.body
+        self._ensure_populated()
+        body_parser.check_format(self.structure)
+        full = self._cached_body()
+        if full is not None:
+            return slice_body(full, columns, limit, offset)
+        key = None
+        if self.body_path:
+            key = cache.partial_key(self.body_path, columns, limit, offset)
+            df = cache.instance().get(key)
+            if df is not None:
+                return df
+        ref = self._ref()
+        df = loader.instance().load_body(ref, self.structure, columns=columns,
+                                         limit=limit, offset=offset)
+        # Number rows by their position in the full body
+        start = offset or 0
+        df.index = pandas.RangeIndex(start, start + len(df))
+        if key:
+            cache.instance().put(key, df)
+        return df
+
+    def filter(self, expr, columns=None, params=None, stream=False):
+        """Select the rows of the body that match a sql expression, such as
+           "year > 2000". If the body isn't already loaded or cached the
+           filter is run by qri, so the full body is never loaded. Values in
+           params are bound to placeholders in the expression, as with
+           qri.sql"""
+        cols = ', '.join(columns) if columns else '*'
+        query = 'SELECT %s FROM %s WHERE %s' % (cols, self.human_ref(), expr)
+        return sql_util.run(query, params, stream)
+
+    def diff(self, previous=None):
+        """Compare the body with that of an earlier version, given as a
+           Dataset or a path, by default the previous version. Returns a
+           BodyDiff of the rows added and the rows removed, a changed row
+           is both. Both bodies are taken from the cache if possible"""
+        self._ensure_populated()
+        if previous is None:
+            previous = self.previous_path
+            if not previous:
+                raise error.QriClientError('%s has no previous version' %
+                                           self.human_ref())
+        if not isinstance(previous, Dataset):
+            previous = self.at(previous)
+        added, removed = body_parser.diff_rows(previous.body, self.body)
+        return BodyDiff(added, removed)
+
+    def body_since(self, path):
+        """Rows added to the body since the version at path"""
+        return self.diff(path).added
+
+    def history(self, limit=None,
+                page_size=version_info.DEFAULT_HISTORY_PAGE_SIZE):
+        """Versions of the dataset as VersionInfo objects, newest first and
+           at most limit of them. Versions are fetched lazily a page at a
+           time, rather than one call per version"""
+        return version_info.History(dsref.Ref(self.username, self.name),
+                                    limit, page_size)
+
+    def at(self, path):
+        """The version of the dataset at path. Versions are immutable, so
+           its metadata and body are taken from the caches when present"""
+        if self.path == path and self._is_populated:
+            return self
+        obj = loader.instance().get_dataset_object(
+            dsref.Ref(self.username, self.name, path))
+        ds = Dataset(dict(obj, username=self.username, name=self.name))
+        ds._version = path
+        return ds
+
+    def _load_body(self):
+        df = self._cached_body()
+        if df is not None:
+            return df
+        ref = self._ref()
+        df = loader.instance().load_body(ref, self.structure)
+        self._store_body(df)
+        return df
+
+    def _cached_body(self):
+        if self.body_component is not None:
+            return self.body_component
+        # The body path is a content address, so a cached body for it
+        # can never be stale
+        if self.body_path:
+            return cache.instance().get(self.body_path)
+        return None
+
+    def _store_body(self, df):
+        if self.body_path:
+            cache.instance().put(self.body_path, df)
+            sql_util.local_engine().remember(self.body_path, df)
+
+    def iter_body(self, chunksize=DEFAULT_CHUNKSIZE):
+        """Iterate over the body as DataFrames of at most chunksize rows,
+           without holding the entire body in memory"""
+        self._ensure_populated()
+        body_parser.check_format(self.structure)
+        df = self._cached_body()
+        if df is not None:
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+            return
+        ref = self._ref()
+        for chunk in loader.instance().iter_body(ref, self.structure,
+                                                 chunksize):
+            yield chunk
+
+    def body_chunks(self, chunksize=DEFAULT_CHUNKSIZE):
+        """alias for iter_body"""
+        return self.iter_body(chunksize)
+
+    async def aload_body(self):
+        """Load the body without blocking the event loop"""
+        await self._aensure_populated()
+        body_parser.check_format(self.structure)
         if self.body_component is None:
-            ref = dsref.Ref(self.username, self.name)
-            df = loader.instance().load_body(ref, self.structure)
+            df = self._cached_body()
+            if df is None:
+                ref = self._ref()
+                df = await loader.acall('load_body', ref, self.structure)
+                self._store_body(df)
             self.body_component = df
         return self.body_component
 
+    async def aiter_body(self, chunksize=DEFAULT_CHUNKSIZE):
+        """Asynchronously iterate over the body as DataFrames of at most
+           chunksize rows"""
+        await self._aensure_populated()
+        body_parser.check_format(self.structure)
+        df = self._cached_body()
+        if df is not None:
+            for start in range(0, len(df), chunksize):
+                yield df.iloc[start:start + chunksize]
+            return
+        ref = self._ref()
+        async for chunk in loader.aiter_body(ref, self.structure, chunksize):
+            yield chunk
+
     def human_ref(self):
         return '%s/%s' % (self.username, self.name)
 
@@ -200,7 +396,70 @@ class Dataset(object):
         return text
 
 
+LAZY_COMPONENTS = {
+    'commit_component': ('commit', Commit),
+    'meta_component': ('meta', Meta),
+    'readme_component': ('readme', Readme),
+    'structure_component': ('structure', Structure),
+}
+
+
+def slice_body(df, columns=None, limit=None, offset=None):
+    """Select part of an already loaded body"""
+    start = offset or 0
+    end = start + limit if limit is not None else None
+    df = df.iloc[start:end]
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+
 class DatasetList(list):
+    """A list of datasets. Entries from a listing only have summary info,
+       and are populated individually when their components are first
+       accessed, or all at once by calling populate"""
+    def __init__(self, items=(), errors=None):
+        super(DatasetList, self).__init__(items)
+        # Errors for datasets that could not be loaded, keyed by reference
+        self.errors = errors or {}
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return DatasetList(super(DatasetList, self).__getitem__(key))
+        return super(DatasetList, self).__getitem__(key)
+
+    def page(self, number, size=25):
+        """Return the page with the given number, counting from 0, without
+           populating any of its datasets"""
+        return self[number * size:(number + 1) * size]
+
+    def populate(self, parallel=True, max_workers=config.DEFAULT_MAX_WORKERS):
+        """Fetch full datasets for every entry that only has summary info,
+           concurrently if parallel is set. Failures are recorded in errors,
+           keyed by reference"""
+        pending = [ds for ds in self if not ds._is_populated]
+        if not pending:
+            return self
+        # Pick the backend once, before any worker threads use it
+        loader.instance()
+
+        def fetch(ds):
+            try:
+                ds._ensure_populated()
+            except Exception as e:
+                return e
+            return None
+
+        if parallel and len(pending) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                results = [r for r in pool.map(fetch, pending)]
+        else:
+            results = [fetch(ds) for ds in pending]
+        for ds, err in zip(pending, results):
+            if err is not None:
+                self.errors[ds.human_ref()] = err
+        return self
+
     def __repr__(self):
         content = ', '.join(['%s' % d for d in self])
         return '[%s]' % (content,)
@@ -214,7 +473,9 @@ class DatasetList(list):
             if ds.username != curr_username:
                 curr_username = ds.username
                 disp_username = ds.username
-            meta_title = max_len(ds.meta_title or NO_META_TITLE, 50)
+            # Only use what is already known, rendering must never cause
+            # each dataset to be fetched
+            meta_title = max_len(ds._known_meta_title() or NO_META_TITLE, 50)
             rows += f"""<tr>
                     <td><b>{disp_username}</b></td>
                     <td>{meta_title}</td>
@@ -4,24 +4,31 @@ from . import error
 
 
 class Ref(object):
-    def __init__(self, username, name):
+    def __init__(self, username, name, path=None):
         self.username = username
         self.name = name
+        self.path = path
 
     def human(self):
         return '{}/{}'.format(self.username, self.name)
 
+    def versioned(self):
+        """The human reference, pinned to a version if the path is set"""
+        if self.path:
+            return '{}@{}'.format(self.human(), self.path)
+        return self.human()
+
     def clone(self):
-        return Ref(self.username, self.name)
+        return Ref(self.username, self.name, self.path)
 
     def __str__(self):
-        return self.human()
+        return self.versioned()
 
 
 def parse_ref(s):
-    m = re.match(r'^([a-z][a-z0-9_-]*)/([a-z][a-z0-9_-]*)$', s)
+    m = re.match(r'^([a-z][a-z0-9_-]*)/([a-z][a-z0-9_-]*)(?:@(/\S+))?$', s)
     if m:
         username = m.group(1)
         name = m.group(2)
-        return Ref(username, name)
+        return Ref(username, name, m.group(3))
     raise error.QriClientError('Could not parse reference "{}"'.format(s))
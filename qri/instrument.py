@@ -0,0 +1,159 @@
+"""Timing and counts for backend calls, parsing and caching. Events are
+   sent to listeners, one of which is an in-memory collector whose totals
+   are returned by qri.stats()"""
+
+import contextlib
+import logging
+import threading
+import time
+
+from . import error
+
+
+# Numeric attributes that are totalled by the stats collector
+SUMMED_ATTRS = ('bytes', 'rows', 'values')
+
+_listeners = []
+_lock = threading.Lock()
+
+logger = logging.getLogger('qri')
+
+
+class Event(object):
+    """Something that happened, such as a process being spawned or a body
+       being parsed. duration is in seconds, or None for a plain count"""
+    __slots__ = ('name', 'start', 'duration', 'attrs')
+
+    def __init__(self, name, start, duration=None, attrs=None):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.attrs = attrs or {}
+
+    def __repr__(self):
+        return 'Event(%r, %r, %r)' % (self.name, self.duration, self.attrs)
+
+
+def add_listener(listener):
+    """Call listener with every Event from now on"""
+    with _lock:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    with _lock:
+        if listener in _listeners:
+            _listeners.remove(listener)
+
+
+def emit(name, duration=None, start=None, **attrs):
+    """Send an event to every listener. Listeners that fail are logged and
+       otherwise ignored, instrumentation never breaks a call"""
+    if not _listeners:
+        return
+    if start is None:
+        start = time.time() - (duration or 0)
+    event = Event(name, start, duration, attrs)
+    for listener in list(_listeners):
+        try:
+            listener(event)
+        except Exception:
+            logger.exception('qri instrumentation listener failed')
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """Time the enclosed block and emit it as an event. The yielded dict of
+       attributes can be added to before the block ends. If the block raises,
+       the error type is recorded"""
+    start = time.time()
+    began = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs['error'] = type(e).__name__
+        raise
+    finally:
+        emit(name, time.perf_counter() - began, start, **attrs)
+
+
+class StatsCollector(object):
+    """Totals per event name: count, total and max seconds, and the sums of
+       the attributes in SUMMED_ATTRS, such as bytes or rows"""
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            entry = self._totals.get(event.name)
+            if entry is None:
+                entry = self._totals[event.name] = {'count': 0}
+            entry['count'] += 1
+            if event.duration is not None:
+                entry['seconds'] = entry.get('seconds', 0.0) + event.duration
+                entry['max_seconds'] = max(entry.get('max_seconds', 0.0),
+                                           event.duration)
+            for key in SUMMED_ATTRS:
+                if key in event.attrs:
+                    entry[key] = entry.get(key, 0) + event.attrs[key]
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._totals.items()}
+
+    def reset(self):
+        with self._lock:
+            self._totals = {}
+
+
+class LoggingExporter(object):
+    """Logs every event, at debug level by default"""
+    def __init__(self, log=None, level=logging.DEBUG):
+        self.log = log or logger
+        self.level = level
+
+    def __call__(self, event):
+        if not self.log.isEnabledFor(self.level):
+            return
+        if event.duration is None:
+            self.log.log(self.level, 'qri %s %r', event.name, event.attrs)
+        else:
+            self.log.log(self.level, 'qri %s %.6fs %r', event.name,
+                         event.duration, event.attrs)
+
+
+class OpenTelemetryExporter(object):
+    """Records every timed event as an OpenTelemetry span, using the
+       globally configured tracer provider unless a tracer is given"""
+    def __init__(self, tracer=None):
+        if tracer is None:
+            try:
+                from opentelemetry import trace
+            except ImportError:
+                raise error.QriClientError(
+                    'The OpenTelemetry exporter needs the opentelemetry-api '
+                    'package: pip install opentelemetry-api')
+            tracer = trace.get_tracer('qri')
+        self.tracer = tracer
+
+    def __call__(self, event):
+        if event.duration is None:
+            return
+        start = int(event.start * 1e9)
+        span = self.tracer.start_span('qri.%s' % event.name, start_time=start)
+        for key, val in event.attrs.items():
+            span.set_attribute(key, val)
+        span.end(end_time=start + int(event.duration * 1e9))
+
+
+collector = StatsCollector()
+add_listener(collector)
+
+
+def stats():
+    return collector.snapshot()
+
+
+def reset_stats():
+    collector.reset()
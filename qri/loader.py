@@ -1,11 +1,21 @@
+import asyncio
 import base64
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import io
 import json
-import pandas
+import os
+import shutil
+import tempfile
+import threading
+import time
 
-from . import cmd_util, error, util
-import requests
-from subprocess import Popen, PIPE
+from . import body, cmd_util, config, error, instrument, transport, util
+from .body import pd_type
+from .util import LazyModule
+
+
+pandas = LazyModule('pandas')
 
 
 _inst = None
@@ -14,29 +24,314 @@ _inst = None
 def instance():
     global _inst
     if _inst is None:
-        print
-        proc = Popen(['which', 'qri'], stdout=PIPE)
-        stdout, err = proc.communicate()
-        if proc.returncode == 0:
-            # Have a local qri binary
-            _inst = LocalQriBinaryRepo()
-        else:
-            # Send http requests to api.qri.cloud
-            _inst = CloudAPIRepo()
+        repo = detect_repo()
+        if config.metadata_ttl() > 0:
+            repo = CachingLoader(repo, ttl=config.metadata_ttl(),
+                                 max_entries=config.metadata_max_entries())
+        _inst = repo
     return _inst
 
 
+BACKENDS = ('auto', 'api', 'binary', 'cloud')
+
+
+def detect_repo():
+    """Find the backend to use. QRI_BACKEND can name one explicitly,
+       otherwise a running local API server is preferred, then a qri binary,
+       then qri cloud. The detected backend is remembered in a state file
+       for backend_ttl seconds, so other processes can skip the search"""
+    choice = config.backend()
+    if choice not in BACKENDS:
+        raise error.QriClientError('Unknown QRI_BACKEND "%s", expected one '
+                                   'of %s' % (choice, ', '.join(BACKENDS)))
+    if choice == 'api':
+        return LocalAPIRepo()
+    elif choice == 'binary':
+        return LocalQriBinaryRepo(find_binary())
+    elif choice == 'cloud':
+        return CloudAPIRepo()
+    repo = repo_from_state(read_backend_state())
+    if repo is None:
+        repo, state = search_backends()
+        write_backend_state(state)
+    return repo
+
+
+def find_binary():
+    """Path of the qri binary: QRI_BINARY if set, otherwise looked up on
+       PATH without spawning a process"""
+    return config.qri_binary() or shutil.which('qri')
+
+
+def search_backends():
+    """Return the best available backend, and the state that records it"""
+    state = {'api_url': config.api_url(), 'qri_binary': config.qri_binary(),
+             'checked': time.time()}
+    api = LocalAPIRepo()
+    if api.available():
+        # A local qri API server is running, talk to it over http
+        return api, dict(state, backend='api')
+    binary = find_binary()
+    if binary:
+        # Have a local qri binary
+        return (LocalQriBinaryRepo(binary),
+                dict(state, backend='binary', binary=binary))
+    # Send http requests to api.qri.cloud
+    return CloudAPIRepo(), dict(state, backend='cloud')
+
+
+def repo_from_state(state):
+    """The backend recorded in state, if the record is recent, was made with
+       the same settings, and the backend is still usable"""
+    if not state:
+        return None
+    if (time.time() - state.get('checked', 0) > config.backend_ttl() or
+            state.get('api_url') != config.api_url() or
+            state.get('qri_binary') != config.qri_binary()):
+        return None
+    backend = state.get('backend')
+    if backend == 'api':
+        api = LocalAPIRepo()
+        return api if api.available() else None
+    elif backend == 'binary':
+        binary = state.get('binary')
+        if binary and os.access(binary, os.X_OK):
+            return LocalQriBinaryRepo(binary)
+        return None
+    elif backend == 'cloud':
+        return CloudAPIRepo()
+    return None
+
+
+def read_backend_state():
+    if config.backend_ttl() <= 0:
+        return None
+    try:
+        with open(config.backend_state_file()) as fp:
+            state = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    return state if isinstance(state, dict) else None
+
+
+def write_backend_state(state):
+    if config.backend_ttl() <= 0:
+        return
+    filename = config.backend_state_file()
+    tmp = None
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                   suffix='.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(state, fp)
+        os.replace(tmp, filename)
+    except OSError:
+        # Remembering the backend is best effort
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+
 def set_instance(obj):
     global _inst
     _inst = obj
 
 
+def invalidate(ref=None):
+    """Forget memoized metadata for the reference, or for everything if no
+       reference is given"""
+    inst = instance()
+    if hasattr(inst, 'invalidate'):
+        inst.invalidate(ref)
+
+
+async def acall(method, *args, target=None):
+    """Call a method of the loader without blocking the event loop. Uses the
+       loader's native async variant (prefixed with "a") if it has one,
+       otherwise runs the method in the default executor"""
+    inst = target or instance()
+    native = getattr(inst, 'a' + method, None)
+    if native is not None:
+        return await native(*args)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, getattr(inst, method), *args)
+
+
+async def aiter_body(ref, structure, chunksize=body.DEFAULT_CHUNKSIZE):
+    """Iterate over body chunks from the loader without blocking the event
+       loop, natively if possible, otherwise pulling each chunk in the
+       default executor"""
+    inst = instance()
+    native = getattr(inst, 'aiter_body', None)
+    if native is not None:
+        async for chunk in native(ref, structure, chunksize):
+            yield chunk
+        return
+    loop = asyncio.get_event_loop()
+    it = inst.iter_body(ref, structure, chunksize)
+    done = object()
+    while True:
+        chunk = await loop.run_in_executor(None, next, it, done)
+        if chunk is done:
+            break
+        yield chunk
+
+
+class CachingLoader(object):
+    """Wraps a loader, memoizing dataset objects for ttl seconds. Objects
+       are keyed by human reference, and also by their immutable path, and
+       the least recently used are dropped beyond max_entries. Everything
+       other than getting and listing is passed through to the wrapped
+       loader"""
+    def __init__(self, inner, ttl=config.DEFAULT_METADATA_TTL,
+                 max_entries=config.DEFAULT_METADATA_MAX_ENTRIES,
+                 clock=time.monotonic):
+        self.inner = inner
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._by_ref = collections.OrderedDict()
+        self._by_path = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name == 'inner':
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def get_dataset_object(self, ref):
+        key = ('get', ref.versioned())
+        obj = self._lookup_version(ref) or self._lookup(key)
+        if obj is None:
+            obj = self.inner.get_dataset_object(ref)
+            self._store(key, obj)
+        return obj
+
+    async def aget_dataset_object(self, ref):
+        key = ('get', ref.versioned())
+        obj = self._lookup_version(ref) or self._lookup(key)
+        if obj is None:
+            obj = await acall('get_dataset_object', ref, target=self.inner)
+            self._store(key, obj)
+        return obj
+
+    def list_dataset_objects(self, username=None, offset=None, limit=None,
+                             term=None):
+        key = ('list', username, offset, limit, term)
+        objs = self._lookup(key)
+        if objs is None:
+            objs = self.inner.list_dataset_objects(username, offset, limit,
+                                                   term)
+            self._store(key, objs)
+        return objs
+
+    async def alist_dataset_objects(self, username=None, offset=None,
+                                    limit=None, term=None):
+        key = ('list', username, offset, limit, term)
+        objs = self._lookup(key)
+        if objs is None:
+            objs = await acall('list_dataset_objects', username, offset,
+                               limit, term, target=self.inner)
+            self._store(key, objs)
+        return objs
+
+    def pull_dataset(self, ref):
+        result = self.inner.pull_dataset(ref)
+        self.invalidate(ref)
+        return result
+
+    async def apull_dataset(self, ref):
+        result = await acall('pull_dataset', ref, target=self.inner)
+        self.invalidate(ref)
+        return result
+
+    def lookup_path(self, path):
+        """Return the memoized dataset object with the given path, if any.
+           Paths are immutable, so these never expire"""
+        with self._lock:
+            obj = self._by_path.get(path)
+            if obj is None:
+                return None
+            self._by_path.move_to_end(path)
+            return obj
+
+    def _lookup_version(self, ref):
+        # A reference pinned to a version can be answered by path, which
+        # never goes stale
+        if not ref.path:
+            return None
+        obj = self.lookup_path(ref.path)
+        if obj is not None:
+            with self._lock:
+                self.hits += 1
+        return obj
+
+    def invalidate(self, ref=None):
+        """Forget memoized objects for the reference, and all listings. With
+           no reference, forget everything that can go stale"""
+        with self._lock:
+            for key in [k for k in self._by_ref]:
+                if ref is None or key[0] == 'list' or key[1] == ref.human():
+                    del self._by_ref[key]
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._by_ref),
+                    'paths': len(self._by_path)}
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._by_ref.get(key)
+            if entry is not None:
+                expires, obj = entry
+                if self.clock() < expires:
+                    self._by_ref.move_to_end(key)
+                    self.hits += 1
+                    instrument.emit('metadata.hit')
+                    return obj
+                del self._by_ref[key]
+            self.misses += 1
+            instrument.emit('metadata.miss')
+            return None
+
+    def _store(self, key, obj):
+        with self._lock:
+            self._by_ref[key] = (self.clock() + self.ttl, obj)
+            self._by_ref.move_to_end(key)
+            if key[0] == 'get' and isinstance(obj, dict) and obj.get('path'):
+                self._by_path[obj['path']] = obj
+                self._by_path.move_to_end(obj['path'])
+            for entries in (self._by_ref, self._by_path):
+                while len(entries) > self.max_entries:
+                    entries.popitem(last=False)
+
+
 class LocalQriBinaryRepo(object):
+    """Repository accessed by running the qri command-line binary"""
+    def __init__(self, binary=None):
+        self.binary = binary or 'qri'
+
+    def _command(self, *args):
+        return [self.binary] + list(args)
+
     def get_dataset_object(self, ref):
-        cmd = 'qri get --format json %s' % ref.human()
+        cmd = self._command('get', '--format', 'json', ref.versioned())
         result, err = cmd_util.shell_exec(cmd)
         if err:
             raise error.QriClientError(err)
+        return self._decode_dataset_object(result)
+
+    async def aget_dataset_object(self, ref):
+        cmd = self._command('get', '--format', 'json', ref.versioned())
+        result, err = await cmd_util.ashell_exec(cmd)
+        if err:
+            raise error.QriClientError(err)
+        return self._decode_dataset_object(result)
+
+    def _decode_dataset_object(self, result):
         # NOTE: Work-around for auto-pull outputting an info message to stdout
         if result.startswith('pulling '):
             # There is a sentence about pulling, then the json data starting
@@ -45,79 +340,310 @@ class LocalQriBinaryRepo(object):
             result = result[pos:]
         return json.loads(result)
 
-    def list_dataset_objects(self, username=None):
-        if username is not None:
-            raise error.QriClientError('listing with username not supported')
-        cmd = 'qri list --format json'
+    def list_dataset_objects(self, username=None, offset=None, limit=None,
+                             term=None):
+        cmd = self._list_command(username, offset, limit, term)
         result, err = cmd_util.shell_exec(cmd)
         if err:
             raise error.QriClientError(err)
         return json.loads(result)
 
+    async def alist_dataset_objects(self, username=None, offset=None,
+                                    limit=None, term=None):
+        cmd = self._list_command(username, offset, limit, term)
+        result, err = await cmd_util.ashell_exec(cmd)
+        if err:
+            raise error.QriClientError(err)
+        return json.loads(result)
+
+    def _list_command(self, username, offset, limit, term):
+        # Paging and filtering are done by qri, so only the requested
+        # entries are ever output
+        cmd = self._command('list', '--format', 'json')
+        if username is not None:
+            cmd += ['--peer', username]
+        if offset is not None:
+            cmd += ['--offset', str(offset)]
+        if limit is not None:
+            cmd += ['--limit', str(limit)]
+        if term:
+            cmd.append(term)
+        return cmd
+
+    def history_objects(self, ref, offset=None, limit=None):
+        # One process lists a whole page of versions
+        cmd = self._command('log', '--format', 'json')
+        if offset is not None:
+            cmd += ['--offset', str(offset)]
+        if limit is not None:
+            cmd += ['--limit', str(limit)]
+        result, err = cmd_util.shell_exec(cmd + [ref.human()])
+        if err:
+            raise error.QriClientError(err)
+        return json.loads(result) or []
+
     def pull_dataset(self, ref):
-        cmd = 'qri pull %s' % ref.human()
+        cmd = self._command('pull', ref.human())
         result, err = cmd_util.shell_exec(cmd)
         if err:
             raise error.QriClientError(err)
         return result
 
-    def load_body(self, ref, structure):
-        if structure.format != 'csv':
-            raise RuntimeError('Format "%s" not supported' % structure.format)
-        cmd = 'qri get body %s' % ref.human()
-        result, err = cmd_util.shell_exec(cmd)
+    async def apull_dataset(self, ref):
+        cmd = self._command('pull', ref.human())
+        result, err = await cmd_util.ashell_exec(cmd)
         if err:
             raise error.QriClientError(err)
-        result = util.ensure_string(result)
-        stream = io.StringIO(result)
-        columns = [e for e in structure.schema['items']['items']]
-        col_names = [c['title'] for c in columns]
-        types = {c['title']: pd_type(c['type']) for c in columns}
-        header = 0 if structure.format_config.get('headerRow') else None
-        df = None
-        try:
-            # Try to parse the csv using the schema
-            df = pandas.read_csv(stream, header=header, names=col_names,
-                                 dtype=types)
-        except (TypeError, ValueError):
-            # If pandas encountered parse errors, reparse without datatypes
-            stream = io.StringIO(util.ensure_string(result))
-            df = pandas.read_csv(stream, header=header, names=col_names)
-        return df
+        return result
+
+    def sql(self, query, types=None):
+        cmd = self._command('sql', '--format', 'csv', query)
+        with cmd_util.shell_stream(cmd) as stream:
+            return body.read_result_csv(stream, types)
 
+    def iter_sql(self, query, types=None, chunksize=body.DEFAULT_CHUNKSIZE):
+        cmd = self._command('sql', '--format', 'csv', query)
+        with cmd_util.shell_stream(cmd) as stream:
+            for chunk in body.iter_result_csv(stream, types, chunksize):
+                yield chunk
+
+    def load_body(self, ref, structure, columns=None, limit=None,
+                  offset=None):
+        body.check_format(structure)
+        body.check_columns(structure, columns)
+        cmd = self._body_command(ref, structure, limit, offset)
+        with cmd_util.shell_stream(cmd) as stream:
+            workers = self._parse_workers(structure, limit)
+            if workers > 1:
+                return body.read_csv_parallel(stream, structure, workers,
+                                              columns)
+            return body.read(stream, structure, columns, limit)
+
+    def _parse_workers(self, structure, limit):
+        """Number of processes to parse a body with, more than one only for
+           an entire csv body that is larger than the configured size"""
+        threshold = config.parallel_parse_bytes()
+        if (structure.format != 'csv' or limit is not None or
+                threshold <= 0 or not isinstance(structure.length, int) or
+                structure.length <= threshold):
+            return 1
+        return config.parse_workers()
+
+    def iter_body(self, ref, structure, chunksize=body.DEFAULT_CHUNKSIZE):
+        body.check_format(structure)
+        cmd = self._body_command(ref, structure)
+        with cmd_util.shell_stream(cmd) as stream:
+            for chunk in body.iter_chunks(stream, structure, chunksize):
+                yield chunk
+
+    async def aload_body(self, ref, structure):
+        body.check_format(structure)
+        cmd = self._body_command(ref, structure)
+        blocks = [b async for b in cmd_util.ashell_stream(cmd)]
+        return body.read(io.BytesIO(b''.join(blocks)), structure)
+
+    async def aiter_body(self, ref, structure,
+                         chunksize=body.DEFAULT_CHUNKSIZE):
+        body.check_format(structure)
+        cmd = self._body_command(ref, structure)
+        blocks = cmd_util.ashell_stream(cmd)
+        if structure.format == 'csv':
+            async for chunk in body.aiter_csv(blocks, structure, chunksize):
+                yield chunk
+            return
+        # Columnar bodies are decoded once they have been fully received
+        data = b''.join([b async for b in blocks])
+        for chunk in body.iter_chunks(io.BytesIO(data), structure, chunksize):
+            yield chunk
+
+    def _body_command(self, ref, structure, limit=None, offset=None):
+        cmd = self._command('get', 'body')
+        if structure.format != 'csv':
+            # Ask for columnar formats explicitly, so they never go through
+            # a text encoding
+            cmd += ['--format', structure.format]
+        # Paging is done by qri, so skipped rows are never output
+        if limit is not None:
+            cmd += ['--limit', str(limit)]
+        if offset is not None:
+            cmd += ['--offset', str(offset)]
+        return cmd + [ref.versioned()]
+
+
+class APIRepo(object):
+    """Repository accessed through the http API of a qri server. If
+       page_rows is set, bodies with more rows than that are downloaded as
+       pages of page_rows, several at a time, with each page parsed as soon
+       as it arrives"""
+    def __init__(self, base_url, page_rows=None, workers=None):
+        self.transport = transport.HTTPTransport(base_url)
+        self.page_rows = page_rows
+        self.workers = workers or config.download_workers()
 
-class CloudAPIRepo(object):
     def get_dataset_object(self, ref):
-        r = requests.get('https://api.qri.cloud/get/%s' % ref.human())
-        return json.loads(r.text)['data']['dataset']
+        result = self.transport.get_json('/get/%s' % ref.versioned())
+        return result['data']['dataset']
+
+    def history_objects(self, ref, offset=None, limit=None):
+        params = {'offset': offset or 0}
+        if limit is not None:
+            params['limit'] = limit
+        else:
+            params['all'] = 'true'
+        result = self.transport.get_json('/history/%s' % ref.human(),
+                                         params=params)
+        return result['data'] or []
+
+    def load_body(self, ref, structure, columns=None, limit=None,
+                  offset=None):
+        body.check_format(structure)
+        body.check_columns(structure, columns)
+        pages = self._pages(structure, limit, offset)
+        if pages is None:
+            with self._get_body(ref, structure, limit, offset) as r:
+                return body.read(r.raw, structure, columns, limit)
+        frames = list(self._load_pages(ref, structure, pages, columns))
+        df = body.concat(frames)
+        failed = list(body.fallbacks(df))
+        if structure.format == 'csv' and failed:
+            # Pages were typed separately, so pages where a column that
+            # fell back elsewhere did convert are fetched again as text
+            typed = [not body.parsed_as_text(frame, failed)
+                     for frame in frames]
+            refetched = self._load_pages(
+                ref, structure, [p for p, t in zip(pages, typed) if t],
+                failed, text=True)
+            texts = [next(refetched) if t else frame[failed]
+                     for frame, t in zip(frames, typed)]
+            _, types, _ = body.csv_options(structure)
+            body.rebuild_fallbacks(df, texts, types)
+        return df
+
+    def iter_body(self, ref, structure, chunksize=body.DEFAULT_CHUNKSIZE):
+        body.check_format(structure)
+        pages = self._pages(structure)
+        if pages is None:
+            with self._get_body(ref, structure) as r:
+                for chunk in body.iter_chunks(r.raw, structure, chunksize):
+                    yield chunk
+            return
+        rechunker = body.Rechunker(chunksize)
+        for df in self._load_pages(ref, structure, pages):
+            for chunk in rechunker.add(df):
+                yield chunk
+        for chunk in rechunker.finish():
+            yield chunk
+
+    def _pages(self, structure, limit=None, offset=None):
+        """(offset, limit) of each page to download, or None if the rows
+           should be downloaded in a single request"""
+        if not self.page_rows or self.page_rows <= 0:
+            return None
+        entries = structure.entries
+        if not isinstance(entries, int):
+            return None
+        start = offset or 0
+        end = entries if limit is None else min(entries, start + limit)
+        if end - start <= self.page_rows:
+            return None
+        return [(n, min(self.page_rows, end - n))
+                for n in range(start, end, self.page_rows)]
+
+    def _load_pages(self, ref, structure, pages, columns=None, text=False):
+        """Download and parse pages concurrently, yielding them in order.
+           With text, the columns are left as text rather than typed"""
+        def load_page(page):
+            page_offset, page_limit = page
+            with self._get_body(ref, structure, page_limit, page_offset) as r:
+                if text:
+                    return body.read_text_columns(r.raw, structure, columns)
+                return body.read(r.raw, structure, columns, page_limit)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for df in util.ordered_map(executor, load_page, pages,
+                                       self.workers):
+                yield df
+
+    def _get_body(self, ref, structure, limit=None, offset=None):
+        params = {'component': 'body', 'format': structure.format,
+                  'download': 'true'}
+        if limit is None and offset is None:
+            params['all'] = 'true'
+        else:
+            # Paging is done by the server, so skipped rows are never sent
+            params['offset'] = offset or 0
+            params['limit'] = limit if limit is not None else -1
+        r = self.transport.get('/get/%s' % ref.versioned(), params=params,
+                               stream=True)
+        r.raw.decode_content = True
+        return r
+
+
+class LocalAPIRepo(APIRepo):
+    """Repository accessed through a long-running local qri API server, as
+       started by `qri connect`. Avoids spawning a process per call"""
+    def __init__(self, base_url=None):
+        super(LocalAPIRepo, self).__init__(base_url or config.api_url())
+
+    def available(self):
+        return self.transport.ping()
+
+    def list_dataset_objects(self, username=None, offset=None, limit=None,
+                             term=None):
+        path = '/list'
+        if username is not None:
+            path = '/list/%s' % username
+        params = {}
+        if offset is not None:
+            params['offset'] = offset
+        if limit is not None:
+            params['limit'] = limit
+        else:
+            params['all'] = 'true'
+        if term:
+            params['term'] = term
+        return self.transport.get_json(path, params=params)['data'] or []
 
-    def list_dataset_objects(self, username=None):
+    def pull_dataset(self, ref):
+        result = self.transport.post_json('/pull/%s' % ref.human())
+        return (result.get('data') or {}).get('path', '')
+
+    def sql(self, query, types=None):
+        with self._post_sql(query) as r:
+            return body.read_result_csv(r.raw, types)
+
+    def iter_sql(self, query, types=None, chunksize=body.DEFAULT_CHUNKSIZE):
+        with self._post_sql(query) as r:
+            for chunk in body.iter_result_csv(r.raw, types, chunksize):
+                yield chunk
+
+    def _post_sql(self, query):
+        r = self.transport.post('/sql', json={'query': query, 'format': 'csv'},
+                                stream=True)
+        r.raw.decode_content = True
+        return r
+
+
+class CloudAPIRepo(APIRepo):
+    def __init__(self, base_url=None, page_rows=None, workers=None):
+        super(CloudAPIRepo, self).__init__(
+            base_url or config.cloud_url(),
+            page_rows=config.download_page_rows() if page_rows is None
+            else page_rows,
+            workers=workers)
+
+    def list_dataset_objects(self, username=None, offset=None, limit=None,
+                             term=None):
         raise error.CloudMissingAPIError('CloudAPIRepo.list_dataset_objects')
 
     def pull_dataset(self, ref):
         raise error.CloudMissingAPIError('CloudAPIRepo.pull_dataset')
 
-    def load_body(self, ref, structure):
-        if structure.format != 'csv':
-            raise RuntimeError('Format "%s" not supported' % structure.format)
-        qparams = ['component=body', 'format=csv', 'download=true', 'all=true']
-        r = requests.get('https://api.qri.cloud/get/%s?%s' %
-                         (ref.human(), '&'.join(qparams)))
-        stream = io.StringIO(r.text)
-        columns = [e for e in structure.schema['items']['items']]
-        col_names = [c['title'] for c in columns]
-        types = {c['title']: pd_type(c['type']) for c in columns}
-        header = 0 if structure.format_config.get('headerRow') else None
-        df = None
-        try:
-            # Try to parse the csv using the schema
-            df = pandas.read_csv(stream, header=header, names=col_names,
-                                 dtype=types)
-        except (TypeError, ValueError):
-            # If pandas encountered parse errors, reparse without datatypes
-            stream = io.StringIO(r.text)
-            df = pandas.read_csv(stream, header=header, names=col_names)
-        return df
+    def sql(self, query, types=None):
+        raise error.CloudMissingAPIError('CloudAPIRepo.sql')
+
+    def iter_sql(self, query, types=None, chunksize=body.DEFAULT_CHUNKSIZE):
+        raise error.CloudMissingAPIError('CloudAPIRepo.iter_sql')
 
 
 def from_json(json_text):
@@ -126,17 +652,3 @@ def from_json(json_text):
 
 def base64_decode(bdata):
     return base64.b64decode(bdata)
-
-
-def pd_type(t):
-    if t == 'integer':
-        return 'int64'
-    elif t == 'number':
-        return 'float64'
-    elif t == 'string':
-        return 'string'
-    elif t == 'bool':
-        return 'bool'
-    elif t == 'array':
-        return 'array'
-    raise RuntimeError('Unknown type: "%s"' % t)
@@ -0,0 +1,348 @@
+"""Helpers for running sql queries against datasets"""
+
+import collections.abc
+import hashlib
+import math
+import re
+import threading
+import weakref
+
+
+from . import body, cache, config, dsref, error, loader
+from .util import LazyModule
+
+
+pandas = LazyModule('pandas')
+sqlite3 = LazyModule('sqlite3')
+
+
+REF = r'([a-z][a-z0-9_-]*/[a-z][a-z0-9_-]*)(?![\w/-])'
+# A dataset reference is only looked for where a table can be named, after
+# FROM or JOIN, or after a comma in the list of tables that follows FROM.
+# Elsewhere a/b is a division
+TABLE_REF = re.compile(r'\b(?i:FROM|JOIN)\s+' + REF)
+NEXT_TABLE_REF = re.compile(r'(?:\s+(?:(?i:AS)\s+)?[A-Za-z_]\w*)?\s*,\s*' +
+                            REF)
+STRING_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+NAMED_PARAM = re.compile(r':([A-Za-z_][A-Za-z0-9_]*)')
+
+ENGINES = ('auto', 'local', 'qri')
+
+
+_engine = None
+
+
+def local_engine():
+    global _engine
+    if _engine is None:
+        _engine = LocalEngine()
+    return _engine
+
+
+def run(query, params=None, stream=False, chunksize=body.DEFAULT_CHUNKSIZE,
+        engine='auto'):
+    """Run a query, with params bound to its placeholders. The result is
+       typed using the schemas of the datasets the query refers to. If
+       stream is set, return an iterator of DataFrames of at most chunksize
+       rows instead of the entire result.
+
+       The engine is "local" to run in-process over bodies that are already
+       loaded or cached, "qri" to have qri run it, or "auto" to run locally
+       when every dataset is available and use qri otherwise"""
+    check_engine(engine)
+    query = bind_params(query, params)
+    objs = referenced_objects(query)
+    types = result_types(objs)
+    result = run_local(query, objs, types, stream, chunksize, engine)
+    if result is not None:
+        return result
+    if stream:
+        return loader.instance().iter_sql(query, types, chunksize)
+    return loader.instance().sql(query, types)
+
+
+def check_engine(engine):
+    if engine not in ENGINES:
+        raise error.QriClientError('Unknown sql engine "%s"' % engine)
+
+
+def run_local(query, objs, types, stream=False,
+              chunksize=body.DEFAULT_CHUNKSIZE, engine='auto'):
+    """Run a query in-process if the engine allows it and every dataset it
+       uses is available locally. Returns None if the query should be
+       handed to qri instead"""
+    if engine == 'qri':
+        return None
+    paths = {ref: (obj or {}).get('bodyPath') for ref, obj in objs}
+    local = local_engine()
+    if all(local.has_body(p) for p in paths.values()) and paths:
+        try:
+            return local.run(query, paths, types, stream, chunksize)
+        # pandas.io.sql.DatabaseError is raised by to_sql, and exists in
+        # every supported pandas unlike pandas.errors.DatabaseError
+        except (sqlite3.Error, pandas.io.sql.DatabaseError) as e:
+            if engine == 'local':
+                raise error.QriClientError(str(e))
+    elif engine == 'local':
+        missing = [r for r, p in paths.items() if not local.has_body(p)]
+        raise error.QriClientError('Bodies not available locally: %s' %
+                                   ', '.join(missing))
+    return None
+
+
+def literal(value):
+    """Render a python value as a sql literal"""
+    if value is None:
+        return 'NULL'
+    elif isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    elif isinstance(value, int):
+        return str(value)
+    elif isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            raise error.QriClientError('Cannot use %r as a sql value' % value)
+        return repr(value)
+    elif isinstance(value, str):
+        return "'%s'" % value.replace("'", "''")
+    raise error.QriClientError('Cannot use %r as a sql value' % (value,))
+
+
+def bind_params(query, params):
+    """Replace placeholders outside of quoted strings with literal values:
+       "?" for each item of a sequence, or ":name" for a mapping"""
+    if params is None:
+        return query
+    named = isinstance(params, collections.abc.Mapping)
+    values = iter([] if named else params)
+    out = []
+    pos = 0
+    quote = None
+    while pos < len(query):
+        c = query[pos]
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in '\'"':
+            quote = c
+        elif c == '?' and not named:
+            try:
+                out.append(literal(next(values)))
+            except StopIteration:
+                raise error.QriClientError('Not enough sql params')
+            pos += 1
+            continue
+        elif c == ':' and named:
+            m = NAMED_PARAM.match(query, pos)
+            if m:
+                if m.group(1) not in params:
+                    raise error.QriClientError('Missing sql param "%s"' %
+                                               m.group(1))
+                out.append(literal(params[m.group(1)]))
+                pos = m.end()
+                continue
+        out.append(c)
+        pos += 1
+    done = object()
+    if not named and next(values, done) is not done:
+        raise error.QriClientError('Too many sql params')
+    return ''.join(out)
+
+
+def table_refs(text):
+    """Yield a match for each dataset reference in a table position, with
+       the reference as its first group"""
+    for m in TABLE_REF.finditer(text):
+        yield m
+        pos = m.end()
+        while True:
+            m = NEXT_TABLE_REF.match(text, pos)
+            if m is None:
+                break
+            yield m
+            pos = m.end()
+
+
+def referenced_refs(query):
+    """Return the dataset references that the query uses, in order"""
+    text = STRING_PATTERN.sub("''", query)
+    refs = []
+    seen = set()
+    for m in table_refs(text):
+        if m.group(1) in seen:
+            continue
+        seen.add(m.group(1))
+        refs.append(dsref.parse_ref(m.group(1)))
+    return refs
+
+
+def referenced_objects(query):
+    """Return (human reference, dataset object) for each dataset the query
+       refers to. The object is None if qri couldn't find the dataset"""
+    result = []
+    for ref in referenced_refs(query):
+        try:
+            obj = loader.instance().get_dataset_object(ref)
+        except error.QriClientError:
+            obj = None
+        result.append((ref.human(), obj))
+    return result
+
+
+def result_types(objs):
+    """Column types for a query result, taken from the schemas of the
+       datasets that the query refers to. Datasets that couldn't be fetched
+       are skipped, their columns are left as parsed"""
+    types = {}
+    for _, obj in objs:
+        if obj is None:
+            continue
+        _, ref_types = body.columns_from_schema(
+            (obj.get('structure') or {}).get('schema'))
+        for name, t in ref_types.items():
+            types.setdefault(name, t)
+    return types
+
+
+def replace_refs(query, tables):
+    """Replace dataset references outside of quoted strings with quoted
+       table names"""
+    out = []
+    pos = 0
+    for m in STRING_PATTERN.finditer(query):
+        out.append(_replace_refs(query[pos:m.start()], tables))
+        out.append(m.group(0))
+        pos = m.end()
+    out.append(_replace_refs(query[pos:], tables))
+    return ''.join(out)
+
+
+def _replace_refs(text, tables):
+    out = []
+    pos = 0
+    for m in table_refs(text):
+        table = tables.get(m.group(1))
+        if table:
+            out.append(text[pos:m.start(1)])
+            out.append('"%s"' % table)
+            pos = m.end(1)
+    out.append(text[pos:])
+    return ''.join(out)
+
+
+class LocalEngine(object):
+    """Runs sql in-process using sqlite, over bodies that are already loaded
+       or cached. Each body is copied into the database once, keyed by its
+       content address, so repeated queries don't pay for it again. Once the
+       copies take more than max_bytes, the least recently queried are
+       dropped"""
+    def __init__(self, max_bytes=None):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.max_bytes = (config.local_sql_max_bytes() if max_bytes is None
+                          else max_bytes)
+        # body path -> (table name, size in bytes), least recent first
+        self.tables = collections.OrderedDict()
+        self.size = 0
+        # Number of streamed results that are still being read
+        self.reading = 0
+        self.loaded = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+
+    def remember(self, body_path, df):
+        """Note a body that has been loaded, without copying it yet. Only a
+           weak reference is kept"""
+        if body_path and isinstance(df, pandas.DataFrame):
+            self.loaded[body_path] = df
+
+    def has_body(self, body_path):
+        if not body_path:
+            return False
+        return (body_path in self.tables or body_path in self.loaded or
+                cache.instance().contains(body_path))
+
+    def register(self, body_path, df):
+        """Make a body available to queries, return its table name"""
+        with self.lock:
+            name = self._register(body_path, df)
+            self._evict(keep=(name,))
+            return name
+
+    def _register(self, body_path, df):
+        if body_path in self.tables:
+            self.tables.move_to_end(body_path)
+            return self.tables[body_path][0]
+        digest = hashlib.sha1(body_path.encode('utf-8')).hexdigest()
+        name = 'body_%s' % digest[:16]
+        df.to_sql(name, self.conn, index=False, if_exists='replace')
+        size = int(df.memory_usage(index=False, deep=True).sum())
+        self.tables[body_path] = (name, size)
+        self.size += size
+        return name
+
+    def _evict(self, keep=()):
+        """Drop the least recently used tables until the database is within
+           max_bytes, other than those in keep. sqlite can't drop a table
+           while a statement is running, so nothing is dropped while a
+           streamed result is being read"""
+        if self.reading:
+            return
+        for body_path, (name, size) in list(self.tables.items()):
+            if self.size <= self.max_bytes:
+                return
+            if name in keep:
+                continue
+            self.conn.execute('DROP TABLE IF EXISTS "%s"' % name)
+            del self.tables[body_path]
+            self.size -= size
+
+    def _body(self, ref, body_path):
+        df = self.loaded.get(body_path)
+        if df is None:
+            df = cache.instance().get(body_path)
+        if df is None:
+            raise error.QriClientError('Body of %s is not available '
+                                       'locally' % ref)
+        return df
+
+    def run(self, query, paths, types=None, stream=False,
+            chunksize=body.DEFAULT_CHUNKSIZE):
+        """Run a query where paths maps each dataset reference it uses to
+           the body path of that dataset"""
+        types = types or {}
+        with self.lock:
+            tables = {}
+            for ref, body_path in paths.items():
+                df = None
+                if body_path not in self.tables:
+                    df = self._body(ref, body_path)
+                tables[ref] = self._register(body_path, df)
+            self._evict(keep=tables.values())
+            # The query starts here, so that errors surface from run rather
+            # than on the first iteration of a stream
+            cursor = self.conn.execute(replace_refs(query, tables))
+            columns = [d[0] for d in cursor.description or ()]
+            if not stream:
+                df = pandas.DataFrame.from_records(cursor.fetchall(),
+                                                   columns=columns)
+                return body.apply_types(df, types)
+            self.reading += 1
+        return self._iter_rows(cursor, columns, types, chunksize)
+
+    def _iter_rows(self, cursor, columns, types, chunksize):
+        """Yield the rows of a running query as typed DataFrames. Rows are
+           fetched a chunk at a time, so the full result never exists"""
+        offset = 0
+        try:
+            while True:
+                with self.lock:
+                    rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    return
+                df = pandas.DataFrame.from_records(
+                    rows, columns=columns,
+                    index=pandas.RangeIndex(offset, offset + len(rows)))
+                offset += len(rows)
+                yield body.apply_types(df, types)
+        finally:
+            with self.lock:
+                cursor.close()
+                self.reading -= 1
@@ -0,0 +1,150 @@
+"""HTTP transport for talking to a qri API server"""
+
+import collections
+import http.client
+import threading
+import urllib.parse
+
+from . import config, error, instrument
+from .util import LazyModule
+
+
+requests = LazyModule('requests')
+
+
+PING_TIMEOUT = 0.25
+
+# Responses worth retrying, the server may answer differently next time
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Only idempotent requests are retried
+RETRY_METHODS = frozenset(['GET', 'HEAD'])
+
+
+class HTTPTransport(object):
+    """Sends requests to a qri API using a single pooled session, so that
+       connections are reused across calls. Requests time out, idempotent
+       ones are retried with backoff, and json responses are revalidated
+       using their ETag rather than downloaded again"""
+    def __init__(self, base_url, session=None, timeout=None, retries=None,
+                 backoff=None, max_etags=config.DEFAULT_METADATA_MAX_ENTRIES):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout or (config.http_connect_timeout(),
+                                   config.http_read_timeout())
+        self.retries = config.http_retries() if retries is None else retries
+        self.backoff = config.http_backoff() if backoff is None else backoff
+        self._session = session
+        self.max_etags = max_etags
+        self._etags = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Built on first use, so that finding a server doesn't import requests
+        with self._lock:
+            if self._session is None:
+                self._session = make_session(self.retries, self.backoff)
+            return self._session
+
+    def url(self, path):
+        return '%s/%s' % (self.base_url, path.lstrip('/'))
+
+    def get(self, path, params=None, stream=False, headers=None):
+        with instrument.span('http', method='GET', path=path) as attrs:
+            r = self.session.get(self.url(path), params=params, stream=stream,
+                                 headers=headers, timeout=self.timeout)
+            record_response(r, attrs)
+        check_status(r)
+        return r
+
+    def post(self, path, params=None, json=None, stream=False):
+        with instrument.span('http', method='POST', path=path) as attrs:
+            r = self.session.post(self.url(path), params=params, json=json,
+                                  stream=stream, timeout=self.timeout)
+            record_response(r, attrs)
+        check_status(r)
+        return r
+
+    def get_json(self, path, params=None):
+        key = (path, tuple(sorted((params or {}).items())))
+        with self._lock:
+            cached = self._etags.get(key)
+        headers = {'If-None-Match': cached[0]} if cached else None
+        r = self.get(path, params=params, headers=headers)
+        if r.status_code == 304 and cached:
+            # Unchanged since it was last fetched
+            with self._lock:
+                if key in self._etags:
+                    self._etags.move_to_end(key)
+            return cached[1]
+        result = r.json()
+        etag = r.headers.get('ETag')
+        if etag:
+            with self._lock:
+                self._etags[key] = (etag, result)
+                self._etags.move_to_end(key)
+                while len(self._etags) > self.max_etags:
+                    self._etags.popitem(last=False)
+        return result
+
+    def post_json(self, path, params=None, json=None):
+        return self.post(path, params=params, json=json).json()
+
+    def ping(self, timeout=PING_TIMEOUT):
+        """Return whether the server is up and answering requests. Never
+           retried, a server that isn't running should be noticed quickly"""
+        url = urllib.parse.urlsplit(self.url('/health'))
+        if url.scheme == 'https':
+            conn = http.client.HTTPSConnection(url.netloc, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(url.netloc, timeout=timeout)
+        try:
+            conn.request('GET', url.path)
+            return conn.getresponse().status < 400
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            conn.close()
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+def make_session(retries, backoff):
+    """A session whose connections retry idempotent requests that fail to
+       connect or get a retryable status, waiting longer each time"""
+    from urllib3.util.retry import Retry
+    options = dict(total=retries, backoff_factor=backoff,
+                   status_forcelist=RETRY_STATUSES, raise_on_status=False)
+    try:
+        retry = Retry(allowed_methods=RETRY_METHODS, **options)
+    except TypeError:
+        # urllib3 before 1.26
+        retry = Retry(method_whitelist=RETRY_METHODS, **options)
+    adapter = requests.adapters.HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # Bodies are large and compress well, always ask for compression
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+
+def record_response(r, attrs):
+    # Streamed responses are timed until their headers arrive, and their size
+    # is only known if the server sent it
+    attrs['status'] = r.status_code
+    length = r.headers.get('Content-Length')
+    if length and length.isdigit():
+        attrs['bytes'] = int(length)
+
+
+def check_status(r):
+    if r.ok:
+        return
+    try:
+        msg = r.json()['meta']['error']
+    except (ValueError, KeyError, TypeError):
+        msg = r.text
+    raise error.QriClientError('%s %s: %s' % (r.status_code, r.reason, msg))
@@ -1,20 +1,79 @@
+import collections
+import functools
+import importlib
 import re
 
 
+CAMEL_BOUNDARY = re.compile(r'([^A-Z])([A-Z])')
+
+
+@functools.lru_cache(maxsize=None)
 def to_snake_case(text):
-    return re.sub(r'([^A-Z])([A-Z])', r'\1_\2', text).lower()
-
-
-def set_fields(inst, obj, fields):
-    field_list = []
-    for f in fields:
-        name = to_snake_case(f)
-        field_list.append(name)
-        if obj is None:
-            setattr(inst, name, None)
-        else:
-            setattr(inst, name, obj.get(f))
-    setattr(inst, '_fields', field_list)
+    return CAMEL_BOUNDARY.sub(r'\1_\2', text).lower()
+
+
+@functools.lru_cache(maxsize=None)
+def field_map(fields):
+    """Pairs of (json key, attribute name) for a tuple of json keys"""
+    return tuple((f, to_snake_case(f)) for f in fields)
+
+
+class ComponentMeta(type):
+    """Gives each component class __slots__ for its fields and the mapping
+       from json keys to attribute names, built once per class"""
+    def __new__(mcs, name, bases, namespace):
+        pairs = field_map(tuple(namespace.get('FIELDS', ())))
+        namespace['_field_map'] = pairs
+        namespace['_fields'] = [attr for _, attr in pairs]
+        namespace.setdefault('__slots__', tuple(namespace['_fields']))
+        return super(ComponentMeta, mcs).__new__(mcs, name, bases, namespace)
+
+
+class Component(metaclass=ComponentMeta):
+    """Base for objects built from the fields of a json object. Subclasses
+       list the json keys they keep in FIELDS"""
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, obj):
+        get = (obj or {}).get
+        for key, name in self._field_map:
+            setattr(self, name, get(key))
+
+
+class LazyModule(object):
+    """Stands in for a module that is only imported when one of its
+       attributes is first used, so heavy dependencies don't slow down
+       `import qri`"""
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        # Later lookups of the same attribute don't come back here
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return 'LazyModule(%r)' % self._name
+
+
+def ordered_map(executor, func, items, ahead):
+    """Like executor.map, but with at most ahead calls submitted beyond the
+       result being waited for, so results that aren't consumed yet don't
+       pile up in memory. Results are yielded in order"""
+    items = iter(items)
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) > ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
 
 
 def build_repr(inst):
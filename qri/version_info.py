@@ -1,10 +1,72 @@
-from .util import set_fields
+from . import loader
+from .util import Component
 
 
-class VersionInfo(object):
+DEFAULT_HISTORY_PAGE_SIZE = 100
+
+
+class VersionInfo(Component):
+    FIELDS = ['username', 'name', 'path', 'profileID', 'bodySize', 'bodyRows',
+              'bodyFormat', 'numErrors', 'metaTitle', 'commitTime',
+              'commitTitle', 'commitMessage']
+
     def __init__(self, obj):
-        set_fields(self, obj, ['bodySize', 'bodyRows', 'bodyFormat',
-                               'numErrors', 'metaTitle', 'commitTime'])
+        super(VersionInfo, self).__init__(obj)
+        if self.username is None and obj and 'peername' in obj:
+            self.username = obj.get('peername')
 
     def __repr__(self):
+        if self.path:
+            return 'VersionInfo("%s")' % self.path
         return 'VersionInfo()'
+
+
+class History(object):
+    """Versions of a dataset, newest first. Versions are fetched a page at
+       a time as they are used, so each page costs a single qri call"""
+    def __init__(self, ref, limit=None, page_size=DEFAULT_HISTORY_PAGE_SIZE):
+        self.ref = ref
+        self.limit = limit
+        self.page_size = page_size
+        self._items = []
+        self._done = limit == 0
+
+    def _fetch_page(self):
+        size = self.page_size
+        if self.limit is not None:
+            size = min(size, self.limit - len(self._items))
+        objs = loader.instance().history_objects(self.ref, len(self._items),
+                                                 size)
+        self._items.extend(VersionInfo(o) for o in objs)
+        if len(objs) < size or len(self._items) == self.limit:
+            self._done = True
+
+    def _fetch_until(self, count):
+        while not self._done and (count is None or len(self._items) < count):
+            self._fetch_page()
+
+    def __iter__(self):
+        pos = 0
+        while True:
+            self._fetch_until(pos + 1)
+            if pos >= len(self._items):
+                return
+            yield self._items[pos]
+            pos += 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if (index.start or 0) >= 0 and (index.stop or 0) > 0:
+                self._fetch_until(index.stop)
+            else:
+                self._fetch_until(None)
+            return self._items[index]
+        self._fetch_until(index + 1 if index >= 0 else None)
+        return self._items[index]
+
+    def __len__(self):
+        self._fetch_until(None)
+        return len(self._items)
+
+    def __repr__(self):
+        return 'History("%s")' % self.ref.human()
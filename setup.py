@@ -24,6 +24,9 @@ setuptools.setup(
         'Markdown==3.2.2',
         'requests==2.24.0',
     ],
+    extras_require={
+        'arrow': ['pyarrow'],
+    },
     classifiers=[
         'Programming Language :: Python',
         'License :: OSI Approved :: MIT License',
@@ -0,0 +1,123 @@
+from qri import aio, cache, dataset, dsref, loader
+import asyncio
+import fake_qri
+import json
+import mock_loader
+import tempfile
+import unittest
+from unittest import mock
+
+
+STRUCTURE_OBJ = {
+    'format': 'csv',
+    'formatConfig': {'headerRow': True},
+    'schema': {
+        'items': {
+            'items': [
+                {'title': 'name', 'type': 'string'},
+                {'title': 'count', 'type': 'integer'},
+            ],
+            'type': 'array',
+        },
+        'type': 'array',
+    },
+}
+
+DATASET_OBJ = {
+    'peername': 'peer',
+    'name': 'first_dataset',
+    'path': '/ipfs/QmPath',
+    'structure': STRUCTURE_OBJ,
+}
+
+CSV_BODY = 'name,count\napple,1\n"banana\nsplit",2\ncherry,3\n'
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class AioTests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        cache.set_instance(cache.BodyCache(self.cache_dir.name))
+
+    def tearDown(self):
+        loader.set_instance(None)
+        cache.set_instance(None)
+        self.cache_dir.cleanup()
+
+    def test_get(self):
+        loader.set_instance(mock_loader.MockLoader())
+        ds = run(aio.get('me/first_dataset'))
+        self.assertEqual(str(ds), 'Dataset("my_peer/first_dataset")')
+
+    def test_list(self):
+        loader.set_instance(mock_loader.MockLoader())
+        dlist = run(aio.list())
+        self.assertEqual(len(dlist), 3)
+
+    def test_get_many(self):
+        loader.set_instance(mock_loader.MockLoader())
+        dlist = run(aio.get_many(['me/first_dataset', 'me/missing']))
+        self.assertEqual(str(dlist), '[Dataset("my_peer/first_dataset")]')
+        self.assertEqual(list(dlist.errors), ['me/missing'])
+
+    def test_get_many_limit(self):
+        running = []
+        peak = []
+
+        async def get(refstr):
+            running.append(refstr)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(refstr)
+            return refstr
+
+        with mock.patch.object(aio, 'get', get):
+            dlist = run(aio.get_many(['me/ds_%d' % n for n in range(20)],
+                                     max_concurrency=3))
+        self.assertEqual(len(dlist), 20)
+        self.assertEqual(max(peak), 3)
+
+    def test_aiter_body_in_executor(self):
+        loader.set_instance(mock_loader.SettableLoader(
+            get_responses={'peer/first_dataset': DATASET_OBJ},
+            chunk_responses={'peer/first_dataset': ['chunk1', 'chunk2']}))
+        ds = dataset.Dataset({'username': 'peer', 'name': 'first_dataset',
+                              'bodyRows': 3})
+
+        async def collect():
+            return [c async for c in ds.aiter_body(2)]
+        self.assertEqual(run(collect()), ['chunk1', 'chunk2'])
+
+    def test_local_binary(self):
+        responses = {
+            'get --format json peer/first_dataset': json.dumps(DATASET_OBJ),
+            'get body peer/first_dataset': CSV_BODY,
+        }
+        with fake_qri.FakeQri(responses):
+            loader.set_instance(loader.LocalQriBinaryRepo())
+            ds = run(aio.get('peer/first_dataset'))
+            self.assertEqual(ds.path, '/ipfs/QmPath')
+
+            async def collect():
+                return [c async for c in ds.aiter_body(2)]
+            chunks = run(collect())
+            self.assertEqual([len(c) for c in chunks], [2, 1])
+            self.assertEqual(list(chunks[0]['name']),
+                             ['apple', 'banana\nsplit'])
+            self.assertEqual(list(chunks[1].index), [2])
+            self.assertEqual(str(chunks[1]['count'].dtype), 'Int64')
+
+            df = run(ds.aload_body())
+            self.assertEqual(list(df['count']), [1, 2, 3])
+            self.assertIs(ds.body, df)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,299 @@
+from qri import body
+from qri import error
+from qri import dataset
+import io
+import pandas
+import unittest
+
+
+STRUCTURE_OBJ = {
+    'format': 'csv',
+    'formatConfig': {'headerRow': True},
+    'schema': {
+        'items': {
+            'items': [
+                {'title': 'name', 'type': 'string'},
+                {'title': 'count', 'type': 'integer'},
+                {'title': 'ripe', 'type': 'boolean'},
+                {'title': 'weight', 'type': 'number'},
+            ],
+            'type': 'array',
+        },
+        'type': 'array',
+    },
+}
+
+CSV_BODY = b'''name,count,ripe,weight
+007,1,true,1.5
+banana,2,false,
+cherry,,true,3
+'''
+
+
+class BodyTests(unittest.TestCase):
+    def test_csv_options(self):
+        structure = dataset.Structure(STRUCTURE_OBJ)
+        names, types, header = body.csv_options(structure)
+        self.assertEqual(names, ['name', 'count', 'ripe', 'weight'])
+        self.assertEqual(types, {'name': 'string', 'count': 'Int64',
+                                 'ripe': 'boolean', 'weight': 'float64'})
+        self.assertEqual(header, 0)
+
+    def test_read_csv(self):
+        structure = dataset.Structure(STRUCTURE_OBJ)
+        df = body.read_csv(io.BytesIO(CSV_BODY), structure)
+        self.assertEqual(list(df['name']), ['007', 'banana', 'cherry'])
+        self.assertEqual(str(df['name'].dtype), 'string')
+        self.assertEqual(str(df['count'].dtype), 'Int64')
+        self.assertEqual(df['count'].tolist()[:2], [1, 2])
+        self.assertIs(df['count'][2], pandas.NA)
+        self.assertEqual(str(df['ripe'].dtype), 'boolean')
+        self.assertEqual(df['ripe'].tolist(), [True, False, True])
+        self.assertEqual(str(df['weight'].dtype), 'float64')
+        self.assertEqual(body.fallbacks(df), {})
+
+    def test_read_csv_fallback(self):
+        structure = dataset.Structure(STRUCTURE_OBJ)
+        data = b'name,count,ripe,weight\napple,1,yes,1\nbanana,many,no,2\n'
+        df = body.read_csv(io.BytesIO(data), structure)
+        # Only the columns with bad values fall back, the rest are typed
+        self.assertEqual(body.fallbacks(df), {'count': 1, 'ripe': 2})
+        self.assertEqual(list(df['count']), ['1', 'many'])
+        self.assertEqual(str(df['weight'].dtype), 'float64')
+
+    def test_read_csv_columns_and_rows(self):
+        structure = dataset.Structure(STRUCTURE_OBJ)
+        df = body.read(io.BytesIO(CSV_BODY), structure,
+                       columns=['weight', 'name'], nrows=2)
+        self.assertEqual(list(df.columns), ['weight', 'name'])
+        self.assertEqual(list(df['name']), ['007', 'banana'])
+
+    def test_check_columns(self):
+        structure = dataset.Structure(STRUCTURE_OBJ)
+        body.check_columns(structure, ['name'])
+        with self.assertRaises(error.QriClientError):
+            body.check_columns(structure, ['name', 'color'])
+
+    def test_coerce_column(self):
+        series = pandas.Series([1.0, 2.5, None])
+        converted, failed = body.coerce_column(series, 'Int64')
+        self.assertEqual(failed, 1)
+        converted, failed = body.coerce_column(series, 'float64')
+        self.assertEqual(failed, 0)
+        series = pandas.Series(['1', 'x', None], dtype=object)
+        converted, failed = body.coerce_column(series, 'float64')
+        self.assertEqual(failed, 1)
+
+    def test_unsupported_format(self):
+        structure = dataset.Structure({'format': 'xlsx'})
+        with self.assertRaises(RuntimeError):
+            body.read(io.BytesIO(b''), structure)
+
+    def test_pd_type(self):
+        self.assertEqual(body.pd_type('integer'), 'Int64')
+        self.assertEqual(body.pd_type('bool'), 'boolean')
+        self.assertEqual(body.pd_type('array'), 'object')
+        with self.assertRaises(RuntimeError):
+            body.pd_type('unknown')
+
+    def test_iter_csv(self):
+        structure = dataset.Structure(STRUCTURE_OBJ)
+        chunks = list(body.iter_csv(io.BytesIO(CSV_BODY), structure, 2))
+        self.assertEqual([len(c) for c in chunks], [2, 1])
+        self.assertEqual(list(chunks[1]['name']), ['cherry'])
+        self.assertEqual(str(chunks[1]['count'].dtype), 'Int64')
+
+    def test_read_csv_parallel(self):
+        structure = dataset.Structure(STRUCTURE_OBJ)
+        data = CSV_BODY + b'"quoted\nname",4,false,2\n'
+        df = body.read_csv_parallel(io.BytesIO(data), structure, 2,
+                                    partition_bytes=8)
+        expect = body.read(io.BytesIO(data), structure)
+        pandas.testing.assert_frame_equal(df, expect)
+        df = body.read_csv_parallel(io.BytesIO(data), structure, 2,
+                                    columns=['weight', 'name'],
+                                    partition_bytes=16)
+        self.assertEqual(list(df.columns), ['weight', 'name'])
+        self.assertEqual(df['name'][3], 'quoted\nname')
+
+    def test_read_csv_parallel_fallback(self):
+        structure = dataset.Structure(STRUCTURE_OBJ)
+        data = CSV_BODY + b'fig,x,true,1\nkiwi,1.5,maybe,2\n'
+        df = body.read_csv_parallel(io.BytesIO(data), structure, 2,
+                                    partition_bytes=8)
+        expect = body.read(io.BytesIO(data), structure)
+        pandas.testing.assert_frame_equal(df, expect)
+        self.assertEqual(body.fallbacks(df), {'count': 1, 'ripe': 1})
+
+    def test_diff_rows_fallback(self):
+        old = pandas.DataFrame({'a': pandas.array([1, 2, None],
+                                                  dtype='Int64'),
+                                'b': ['x', 'y', 'z']})
+        # One bad cell leaves the whole column as text
+        new = body.read_result_csv(io.BytesIO(b'a,b\n1,x\n2,y\n,z\nbad,w\n'),
+                                   {'a': 'Int64'})
+        self.assertEqual(body.fallbacks(new), {'a': 1})
+        added, removed = body.diff_rows(old, new)
+        self.assertEqual(list(added['b']), ['w'])
+        self.assertEqual(len(removed), 0)
+        # A column that became a number compares by value
+        new = pandas.DataFrame({'a': [1.0, 2.5, None], 'b': ['x', 'y', 'z']})
+        added, removed = body.diff_rows(old, new)
+        self.assertEqual(list(added['a']), [2.5])
+        self.assertEqual(list(removed['a']), [2])
+
+    def test_find_row_end(self):
+        self.assertEqual(body.find_row_end(b'a,b\nc,d'), (4, False))
+        self.assertEqual(body.find_row_end(b'a,b'), (-1, False))
+        self.assertEqual(body.find_row_end(b'a,"b\nc'), (-1, True))
+        self.assertEqual(body.find_row_end(b'x\nd"\ne,f', True), (5, False))
+
+    def test_row_splitter(self):
+        splitter = body.RowSplitter()
+        self.assertEqual(splitter.feed(b'a,"multi'), b'')
+        self.assertEqual(splitter.feed(b'\nline"\nb,'), b'a,"multi\nline"\n')
+        self.assertEqual(splitter.feed(b'c\n'), b'b,c\n')
+        self.assertEqual(splitter.feed(b'd'), b'')
+        self.assertEqual(splitter.finish(), b'd')
+
+    def test_rechunker(self):
+        rechunker = body.Rechunker(3)
+        pieces = [pandas.DataFrame({'a': range(n)}) for n in (2, 2, 4)]
+        chunks = []
+        for piece in pieces:
+            chunks.extend(rechunker.add(piece))
+        chunks.extend(rechunker.finish())
+        self.assertEqual([len(c) for c in chunks], [3, 3, 2])
+        self.assertEqual(list(chunks[1].index), [3, 4, 5])
+        self.assertEqual(list(chunks[1]['a']), [1, 0, 1])
+
+
+JSON_STRUCTURE_OBJ = {
+    'format': 'json',
+    'schema': {
+        'type': 'array',
+        'items': {
+            'type': 'object',
+            'properties': {
+                'name': {'type': 'string'},
+                'count': {'type': 'integer'},
+            },
+        },
+    },
+}
+
+
+class JSONBodyTests(unittest.TestCase):
+    def test_iter_json_array(self):
+        data = b' [ {"a": 1}, [2, "x]"],\n"s", 12345, {"b": {"c": []}} ] '
+        for blocksize in (1, 3, 1000):
+            values = list(body.iter_json_array(io.BytesIO(data), blocksize))
+            self.assertEqual(values, [{'a': 1}, [2, 'x]'], 's', 12345,
+                                      {'b': {'c': []}}])
+
+    def test_iter_json_array_errors(self):
+        with self.assertRaises(error.QriClientError):
+            list(body.iter_json_array(io.BytesIO(b'{"a": 1}')))
+        with self.assertRaises(error.QriClientError):
+            list(body.iter_json_array(io.BytesIO(b'[1, 2')))
+
+    def test_iter_json_array_multibyte(self):
+        data = '["caf\u00e9", "\u00fcber"]'.encode('utf-8')
+        values = list(body.iter_json_array(io.BytesIO(data), 1))
+        self.assertEqual(values, ['caf\u00e9', '\u00fcber'])
+
+    def test_read_json_objects(self):
+        structure = dataset.Structure(JSON_STRUCTURE_OBJ)
+        data = b'[{"name": "apple", "count": 1}, {"name": "banana"}]'
+        df = body.read(io.BytesIO(data), structure)
+        self.assertEqual(list(df.columns), ['name', 'count'])
+        self.assertEqual(str(df['count'].dtype), 'Int64')
+        self.assertEqual(str(df['name'].dtype), 'string')
+        self.assertIs(df['count'][1], pandas.NA)
+
+    def test_iter_json_arrays(self):
+        obj = dict(STRUCTURE_OBJ)
+        obj['format'] = 'json'
+        structure = dataset.Structure(obj)
+        data = b'[["apple", 1, true, 1.5], ["banana", 2, false, 2], ' \
+               b'["cherry", 3, true, 3]]'
+        chunks = list(body.iter_chunks(io.BytesIO(data), structure, 2))
+        self.assertEqual([len(c) for c in chunks], [2, 1])
+        self.assertEqual(list(chunks[1].index), [2])
+        self.assertEqual(list(chunks[0]['name']), ['apple', 'banana'])
+        self.assertEqual(str(chunks[0]['ripe'].dtype), 'boolean')
+
+    def test_read_json_columns_and_rows(self):
+        obj = dict(STRUCTURE_OBJ)
+        obj['format'] = 'json'
+        structure = dataset.Structure(obj)
+        data = b'[["apple", 1, true, 1.5], ["banana", 2, false, 2], ' \
+               b'["cherry", 3, true, 3]]'
+        df = body.read(io.BytesIO(data), structure, columns=['count', 'name'],
+                       nrows=2)
+        self.assertEqual(list(df.columns), ['count', 'name'])
+        self.assertEqual(list(df['count']), [1, 2])
+
+    def test_read_ndjson(self):
+        obj = dict(JSON_STRUCTURE_OBJ)
+        obj['format'] = 'ndjson'
+        structure = dataset.Structure(obj)
+        data = b'{"name": "apple", "count": 1}\n\n{"name": "b", "count": 2}\n'
+        df = body.read(io.BytesIO(data), structure)
+        self.assertEqual(list(df['count']), [1, 2])
+
+    def test_read_json_without_schema(self):
+        structure = dataset.Structure({'format': 'json'})
+        df = body.read(io.BytesIO(b'[{"x": 1, "y": "a"}]'), structure)
+        self.assertEqual(list(df.columns), ['x', 'y'])
+
+
+@unittest.skipUnless(body.optional_pyarrow(), 'pyarrow is not installed')
+class ColumnarBodyTests(unittest.TestCase):
+    def setUp(self):
+        import pyarrow
+        self.pyarrow = pyarrow
+        self.table = pyarrow.table({'name': ['apple', 'banana', 'cherry'],
+                                    'count': [1, 2, 3]})
+
+    def parquet_bytes(self):
+        sink = io.BytesIO()
+        self.pyarrow.parquet.write_table(self.table, sink)
+        return sink.getvalue()
+
+    def arrow_bytes(self):
+        sink = self.pyarrow.BufferOutputStream()
+        with self.pyarrow.ipc.new_stream(sink, self.table.schema) as writer:
+            for batch in self.table.to_batches(max_chunksize=1):
+                writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+
+    def test_read_parquet(self):
+        structure = dataset.Structure({'format': 'parquet'})
+        df = body.read(io.BytesIO(self.parquet_bytes()), structure)
+        self.assertEqual(list(df['name']), ['apple', 'banana', 'cherry'])
+        self.assertEqual(str(df['count'].dtype), 'int64')
+        self.assertEqual(body.fallbacks(df), {})
+
+    def test_iter_parquet(self):
+        structure = dataset.Structure({'format': 'parquet'})
+        stream = io.BytesIO(self.parquet_bytes())
+        chunks = list(body.iter_chunks(stream, structure, 2))
+        self.assertEqual([len(c) for c in chunks], [2, 1])
+        self.assertEqual(list(chunks[1].index), [2])
+
+    def test_read_arrow(self):
+        structure = dataset.Structure({'format': 'arrow'})
+        df = body.read(io.BytesIO(self.arrow_bytes()), structure)
+        self.assertEqual(list(df['count']), [1, 2, 3])
+
+    def test_iter_arrow(self):
+        structure = dataset.Structure({'format': 'arrow'})
+        stream = io.BytesIO(self.arrow_bytes())
+        chunks = list(body.iter_chunks(stream, structure, 2))
+        self.assertEqual([len(c) for c in chunks], [2, 1])
+        self.assertEqual(list(chunks[1]['name']), ['cherry'])
+
+
+if __name__ == '__main__':
+  unittest.main()
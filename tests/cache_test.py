@@ -0,0 +1,105 @@
+from qri import body, cache
+import os
+import pandas
+import tempfile
+import unittest
+
+
+class CacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_entry_name(self):
+        self.assertEqual(cache.entry_name('/ipfs/QmBodyPath'),
+                         'ipfs_QmBodyPath.pkl')
+        name = cache.entry_name('/ipfs/' + 'Qm' * 100)
+        self.assertEqual(len(name), 40 + len('.pkl'))
+        names = set(cache.entry_name(cache.partial_key('/ipfs/QmBody', c, 10))
+                    for c in (['first', 'name'], ['first_name'], ['a,b'],
+                              ['a', 'b']))
+        self.assertEqual(len(names), 4)
+        self.assertNotEqual(cache.entry_name('/ipfs/a_b'),
+                            cache.entry_name('/ipfs/a/b'))
+
+    def test_get_put(self):
+        c = cache.BodyCache(self.tmpdir.name)
+        self.assertIsNone(c.get('/ipfs/QmBodyPath'))
+        df = pandas.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+        self.assertTrue(c.put('/ipfs/QmBodyPath', df))
+        self.assertTrue(c.contains('/ipfs/QmBodyPath'))
+        got = c.get('/ipfs/QmBodyPath')
+        self.assertTrue(got.equals(df))
+
+    @unittest.skipUnless(body.optional_pyarrow(), 'pyarrow is not installed')
+    def test_arrow_entry(self):
+        c = cache.BodyCache(self.tmpdir.name)
+        df = pandas.DataFrame({'a': [1, None, 3], 'b': ['x', 'y', 'z']})
+        df['a'] = df['a'].astype('Int64')
+        df['b'] = df['b'].astype('string')
+        df.attrs[body.FALLBACKS_ATTR] = {'c': 2}
+        c.put('/ipfs/QmBodyPath', df)
+        self.assertEqual(os.listdir(self.tmpdir.name),
+                         ['ipfs_QmBodyPath.arrow'])
+        got = c.get('/ipfs/QmBodyPath')
+        self.assertEqual(str(got['a'].dtype), 'Int64')
+        self.assertEqual(str(got['b'].dtype), 'string')
+        self.assertEqual(got['a'].tolist()[0], 1)
+        self.assertEqual(body.fallbacks(got), {'c': 2})
+        # Values that arrow can't represent are pickled instead
+        c.put('/ipfs/QmBodyPath', 'not a dataframe')
+        self.assertEqual(os.listdir(self.tmpdir.name),
+                         ['ipfs_QmBodyPath.pkl'])
+
+    def test_corrupt_entry_is_a_miss(self):
+        c = cache.BodyCache(self.tmpdir.name)
+        filename = os.path.join(self.tmpdir.name, 'ipfs_QmBad.pkl')
+        with open(filename, 'w') as fp:
+            fp.write('not a pickle')
+        self.assertIsNone(c.get('/ipfs/QmBad'))
+        self.assertFalse(os.path.exists(filename))
+
+    def test_evict_least_recently_used(self):
+        c = cache.BodyCache(self.tmpdir.name)
+        c.put('/ipfs/QmFirst', 'first')
+        c.put('/ipfs/QmSecond', 'second')
+        c.put('/ipfs/QmThird', 'third')
+        first = os.path.join(self.tmpdir.name, 'ipfs_QmFirst.pkl')
+        second = os.path.join(self.tmpdir.name, 'ipfs_QmSecond.pkl')
+        third = os.path.join(self.tmpdir.name, 'ipfs_QmThird.pkl')
+        os.utime(first, (100, 100))
+        os.utime(second, (300, 300))
+        os.utime(third, (200, 200))
+        # Allow room for only two entries
+        c.max_bytes = os.path.getsize(second) + os.path.getsize(third)
+        c.evict()
+        self.assertFalse(c.contains('/ipfs/QmFirst'))
+        self.assertTrue(c.contains('/ipfs/QmSecond'))
+        self.assertTrue(c.contains('/ipfs/QmThird'))
+
+    def test_info_and_clear(self):
+        c = cache.BodyCache(self.tmpdir.name)
+        c.put('/ipfs/QmFirst', 'first')
+        c.put('/ipfs/QmSecond', 'second')
+        info = c.info()
+        self.assertEqual(info['directory'], self.tmpdir.name)
+        self.assertEqual(info['entries'], 2)
+        self.assertGreater(info['size'], 0)
+        c.clear()
+        self.assertEqual(c.info()['entries'], 0)
+
+    def test_module_api(self):
+        cache.set_instance(cache.BodyCache(self.tmpdir.name))
+        try:
+            cache.instance().put('/ipfs/QmFirst', 'first')
+            self.assertEqual(cache.info()['entries'], 1)
+            cache.clear()
+            self.assertEqual(cache.info()['entries'], 0)
+        finally:
+            cache.set_instance(None)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,4 +1,4 @@
-from qri import client, loader
+from qri import client, error, loader
 import mock_loader
 import unittest
 
@@ -12,6 +12,18 @@ class ClientTests(unittest.TestCase):
         expect = '[Dataset("my_peer/first_dataset"), Dataset("my_peer/second_dataset"), Dataset("other_peer/third_dataset")]'
         self.assertEqual(str(dlist), expect)
 
+    def test_client_list_filter_and_page(self):
+        dlist = client.list(username='my_peer', offset=1, limit=5)
+        self.assertEqual(str(dlist), '[Dataset("my_peer/second_dataset")]')
+        dlist = client.list(term='third')
+        self.assertEqual(str(dlist), '[Dataset("other_peer/third_dataset")]')
+
+    def test_client_list_pages(self):
+        pages = [p for p in client.list_pages(page_size=2)]
+        self.assertEqual([len(p) for p in pages], [2, 1])
+        pages = [p for p in client.list_pages(page_size=3)]
+        self.assertEqual([len(p) for p in pages], [3])
+
     def test_client_get(self):
         ds = client.get('me/first_dataset')
         expect = 'Dataset("my_peer/first_dataset")'
@@ -29,6 +41,14 @@ class ClientTests(unittest.TestCase):
         self.assertEqual(str(readme), '# Hello\n\ncontent')
         self.assertEqual(repr(readme), 'Readme("# Hello\n\ncontent")')
 
+    def test_client_get_many(self):
+        dlist = client.get_many(['me/second_dataset', 'me/first_dataset',
+                                 'me/missing', 'bad+ref'], max_workers=2)
+        expect = '[Dataset("my_peer/second_dataset"), Dataset("my_peer/first_dataset")]'
+        self.assertEqual(str(dlist), expect)
+        self.assertEqual(sorted(dlist.errors), ['bad+ref', 'me/missing'])
+        self.assertIsInstance(dlist.errors['bad+ref'], error.QriClientError)
+
 
 if __name__ == '__main__':
   unittest.main()
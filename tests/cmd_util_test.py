@@ -0,0 +1,29 @@
+from qri import cmd_util, error
+import sys
+import unittest
+
+
+class CmdUtilTests(unittest.TestCase):
+    def test_shell_exec(self):
+        result, err = cmd_util.shell_exec([sys.executable, '-c',
+                                           'print("hello")'])
+        self.assertEqual(result.strip(), 'hello')
+        self.assertIsNone(err)
+
+    def test_shell_stream(self):
+        cmd = [sys.executable, '-c', 'print("a\\nb")']
+        with cmd_util.shell_stream(cmd) as stream:
+            lines = stream.read().splitlines()
+        self.assertEqual(lines, [b'a', b'b'])
+
+    def test_shell_stream_error(self):
+        cmd = [sys.executable, '-c',
+               'import sys; sys.stderr.write("bad ref"); sys.exit(1)']
+        with self.assertRaises(error.QriClientError) as ctx:
+            with cmd_util.shell_stream(cmd) as stream:
+                stream.read()
+        self.assertEqual(str(ctx.exception), 'bad ref')
+
+
+if __name__ == '__main__':
+  unittest.main()
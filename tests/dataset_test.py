@@ -1,6 +1,10 @@
+from qri import cache
 from qri import dataset
+from qri import error
 from qri import loader
 import mock_loader
+import pandas
+import tempfile
 import unittest
 
 
@@ -54,6 +58,14 @@ GET_OBJ = {
 
 
 class DatasetTests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        cache.set_instance(cache.BodyCache(self.cache_dir.name))
+
+    def tearDown(self):
+        cache.set_instance(None)
+        self.cache_dir.cleanup()
+
     def test_init_from_list(self):
         # Ensure loader is never used
         loader.set_instance(mock_loader.NullLoader())
@@ -119,6 +131,16 @@ class DatasetTests(unittest.TestCase):
         self.assertTrue(hasattr(ds, 'meta_component'))
         self.assertEqual(ds.meta.description, 'meta.description')
 
+    def test_components_decoded_lazily(self):
+        loader.set_instance(mock_loader.NullLoader())
+        obj = dict(GET_OBJ, readme={'scriptBytes': 'not base64!'})
+        # The broken readme isn't decoded until it is used
+        ds = dataset.Dataset(obj)
+        self.assertEqual(ds.structure.format, 'csv')
+        self.assertIs(ds.structure, ds.structure_component)
+        with self.assertRaises(ValueError):
+            ds.readme
+
     def test_dont_populate_twice(self):
         loader.set_instance(mock_loader.NullLoader())
         ds = dataset.Dataset(GET_OBJ)
@@ -137,6 +159,227 @@ class DatasetTests(unittest.TestCase):
         ds.body
         self.assertEqual(ds.body_component, 'dataframe standin')
 
+    def test_body_from_cache(self):
+        loader.set_instance(mock_loader.SettableLoader(body_responses={
+            'peer/first_dataset': 'dataframe standin'
+        }))
+        dataset.Dataset(GET_OBJ).body
+        # A new dataset with the same body path is loaded from the cache,
+        # the loader is never used
+        loader.set_instance(mock_loader.NullLoader())
+        ds = dataset.Dataset(GET_OBJ)
+        self.assertEqual(ds.body, 'dataframe standin')
+
+    def test_body_fallbacks(self):
+        df = pandas.DataFrame({'field1': ['a'], 'field2': ['many']})
+        df.attrs['qri_fallbacks'] = {'field2': 1}
+        loader.set_instance(mock_loader.SettableLoader(body_responses={
+            'peer/first_dataset': df
+        }))
+        ds = dataset.Dataset(GET_OBJ)
+        self.assertEqual(ds.body_fallbacks, {'field2': 1})
+
+    def test_load_partial_body(self):
+        calls = []
+
+        class PartialLoader(object):
+            def load_body(self, ref, structure, columns=None, limit=None,
+                          offset=None):
+                calls.append((columns, limit, offset))
+                return pandas.DataFrame({'field2': [2, 3]})
+
+        loader.set_instance(PartialLoader())
+        ds = dataset.Dataset(GET_OBJ)
+        df = ds.load_body(columns=['field2'], limit=2, offset=1)
+        self.assertEqual(list(df.index), [1, 2])
+        self.assertEqual(calls, [(['field2'], 2, 1)])
+        self.assertIsNone(ds.body_component)
+        # The partial body is cached on its own
+        df = dataset.Dataset(GET_OBJ).load_body(columns=['field2'], limit=2,
+                                                offset=1)
+        self.assertEqual(list(df['field2']), [2, 3])
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(cache.instance().contains('/ipfs/QmBodyPath'))
+
+    def test_load_partial_body_from_full(self):
+        full = pandas.DataFrame({'field1': ['a', 'b', 'c'], 'field2': [1, 2, 3]})
+        cache.instance().put('/ipfs/QmBodyPath', full)
+        loader.set_instance(mock_loader.NullLoader())
+        ds = dataset.Dataset(GET_OBJ)
+        df = ds.load_body(columns=['field1'], offset=1)
+        self.assertEqual(list(df['field1']), ['b', 'c'])
+        self.assertEqual(list(df.columns), ['field1'])
+
+    def test_filter(self):
+        queries = []
+
+        class QueryLoader(mock_loader.SettableLoader):
+            def sql(self, query, types=None):
+                queries.append((query, types))
+                return 'filtered'
+
+        loader.set_instance(QueryLoader(get_responses={
+            'peer/first_dataset': GET_OBJ
+        }))
+        ds = dataset.Dataset(GET_OBJ)
+        result = ds.filter('field2 > ?', columns=['field1'], params=[10])
+        self.assertEqual(result, 'filtered')
+        self.assertEqual(queries, [
+            ('SELECT field1 FROM peer/first_dataset WHERE field2 > 10',
+             {'field1': 'string', 'field2': 'Int64'})])
+
+    def test_iter_body(self):
+        loader.set_instance(mock_loader.SettableLoader(chunk_responses={
+            'peer/first_dataset': ['chunk1', 'chunk2']
+        }))
+        ds = dataset.Dataset(GET_OBJ)
+        self.assertEqual(list(ds.iter_body(chunksize=2)), ['chunk1', 'chunk2'])
+        self.assertIsNone(ds.body_component)
+
+    def test_iter_body_from_cache(self):
+        df = pandas.DataFrame({'field1': ['a', 'b', 'c'], 'field2': [1, 2, 3]})
+        cache.instance().put('/ipfs/QmBodyPath', df)
+        loader.set_instance(mock_loader.NullLoader())
+        ds = dataset.Dataset(GET_OBJ)
+        chunks = list(ds.body_chunks(chunksize=2))
+        self.assertEqual([len(c) for c in chunks], [2, 1])
+        self.assertEqual(list(chunks[1]['field1']), ['c'])
+
+    def test_body_since_appended(self):
+        versions = VersionLoader(['a', 'b', 'c'])
+        loader.set_instance(versions)
+        cache.instance().put('/ipfs/QmPreviousBody', people(['a', 'b']))
+        ds = dataset.Dataset(GET_OBJ)
+        added = ds.body_since('/ipfs/QmPreviousPath')
+        self.assertEqual(list(added['field1']), ['c'])
+        self.assertEqual(versions.body_calls, ['peer/first_dataset'])
+        self.assertTrue(cache.instance().contains('/ipfs/QmBodyPath'))
+
+    def test_diff_changed(self):
+        versions = VersionLoader(['a', 'x', 'c', 'd'])
+        loader.set_instance(versions)
+        cache.instance().put('/ipfs/QmPreviousBody',
+                             people(['a', 'b', 'c']))
+        ds = dataset.Dataset(dict(GET_OBJ, structure=dict(
+            GET_OBJ['structure'], entries=4)))
+        diff = ds.diff()
+        self.assertEqual(list(diff.added['field1']), ['x', 'd'])
+        self.assertEqual(list(diff.removed['field1']), ['b'])
+        # The edit in the middle of the body is what gets cached
+        cached = cache.instance().get('/ipfs/QmBodyPath')
+        self.assertEqual(list(cached['field1']), ['a', 'x', 'c', 'd'])
+
+    def test_diff_without_previous(self):
+        loader.set_instance(mock_loader.NullLoader())
+        ds = dataset.Dataset(dict(GET_OBJ, previousPath=None))
+        with self.assertRaises(error.QriClientError):
+            ds.diff()
+
+    def test_history(self):
+        class HistoryLoader(object):
+            calls = []
+
+            def history_objects(self, ref, offset=None, limit=None):
+                self.calls.append((ref.human(), offset, limit))
+                versions = [{'path': '/ipfs/Qm%d' % n, 'commitTitle': str(n)}
+                            for n in range(5)]
+                return versions[offset:offset + limit]
+
+        repo = HistoryLoader()
+        loader.set_instance(repo)
+        ds = dataset.Dataset(LIST_OBJ)
+        history = ds.history(page_size=2)
+        # Nothing is fetched until versions are used
+        self.assertEqual(repo.calls, [])
+        self.assertEqual(history[1].path, '/ipfs/Qm1')
+        self.assertEqual(repo.calls, [('peer/first_dataset', 0, 2)])
+        self.assertEqual([v.commit_title for v in history],
+                         ['0', '1', '2', '3', '4'])
+        self.assertEqual(len(repo.calls), 3)
+        self.assertEqual(len(ds.history(limit=3, page_size=10)), 3)
+        self.assertEqual(repo.calls[-1], ('peer/first_dataset', 0, 3))
+
+    def test_at(self):
+        loader.set_instance(VersionLoader(None))
+        ds = dataset.Dataset(GET_OBJ)
+        prev = ds.at('/ipfs/QmPreviousPath')
+        self.assertEqual(prev.body_path, '/ipfs/QmPreviousBody')
+        self.assertEqual(prev.human_ref(), 'peer/first_dataset')
+        # The previous version's body comes from the cache by its path
+        cache.instance().put('/ipfs/QmPreviousBody', people(['a']))
+        self.assertEqual(list(prev.body['field1']), ['a'])
+        self.assertEqual(ds.at('/ipfs/QmPath'), ds)
+
+
+PREVIOUS_OBJ = dict(GET_OBJ, bodyPath='/ipfs/QmPreviousBody',
+                    path='/ipfs/QmPreviousPath', previousPath=None)
+
+
+def people(names):
+    return pandas.DataFrame({
+        'field1': names,
+        'field2': pandas.array(range(len(names)), dtype='Int64')})
+
+
+class VersionLoader(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.body_calls = []
+
+    def get_dataset_object(self, ref):
+        if ref.versioned() == 'peer/first_dataset@/ipfs/QmPreviousPath':
+            return PREVIOUS_OBJ
+        raise RuntimeError('Got unexpected call to get_dataset_object')
+
+    def load_body(self, ref, structure, columns=None, limit=None,
+                  offset=None):
+        self.body_calls.append(ref.versioned())
+        return people(self.rows)
+
+
+class DatasetListTests(unittest.TestCase):
+    def make_list(self, count):
+        objs = []
+        for n in range(count):
+            obj = dict(LIST_OBJ)
+            obj['name'] = 'dataset_%d' % n
+            obj['metaTitle'] = 'Title %d' % n if n % 2 else None
+            objs.append(obj)
+        return dataset.DatasetList([dataset.Dataset(o) for o in objs])
+
+    def test_slice_and_page(self):
+        loader.set_instance(mock_loader.NullLoader())
+        dlist = self.make_list(5)
+        self.assertIsInstance(dlist[1:3], dataset.DatasetList)
+        self.assertEqual(str(dlist.page(1, size=2)),
+                         '[Dataset("peer/dataset_2"), Dataset("peer/dataset_3")]')
+        self.assertEqual(len(dlist.page(2, size=2)), 1)
+        self.assertFalse(any(ds._is_populated for ds in dlist))
+
+    def test_render_does_not_populate(self):
+        loader.set_instance(mock_loader.NullLoader())
+        dlist = self.make_list(3)
+        html = dlist._repr_html_()
+        self.assertIn('Title 1', html)
+        self.assertIn(dataset.NO_META_TITLE, html)
+        self.assertFalse(any(ds._is_populated for ds in dlist))
+
+    def test_populate(self):
+        dlist = self.make_list(4)
+        responses = {}
+        for ds in dlist[:3]:
+            obj = dict(GET_OBJ)
+            obj['name'] = ds.name
+            responses[ds.human_ref()] = obj
+        loader.set_instance(mock_loader.SettableLoader(
+            get_responses=responses))
+        dlist.populate(max_workers=2)
+        self.assertEqual([ds._is_populated for ds in dlist],
+                         [True, True, True, False])
+        self.assertEqual(list(dlist.errors), ['peer/dataset_3'])
+        self.assertEqual(dlist[0].meta_component.description,
+                         'meta.description')
+
 
 if __name__ == '__main__':
   unittest.main()
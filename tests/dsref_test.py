@@ -7,10 +7,20 @@ class DsrefTests(unittest.TestCase):
         r = dsref.parse_ref('peer/my_ds')
         self.assertEqual(r.username, 'peer')
         self.assertEqual(r.name, 'my_ds')
+        self.assertIsNone(r.path)
+
+    def test_parse_versioned_ref(self):
+        r = dsref.parse_ref('peer/my_ds@/ipfs/QmVersion')
+        self.assertEqual(r.human(), 'peer/my_ds')
+        self.assertEqual(r.path, '/ipfs/QmVersion')
+        self.assertEqual(r.versioned(), 'peer/my_ds@/ipfs/QmVersion')
+        self.assertEqual(str(r.clone()), 'peer/my_ds@/ipfs/QmVersion')
 
     def test_parse_ref_failure(self):
         with self.assertRaises(error.QriClientError):
             dsref.parse_ref('peer/my+ds')
+        with self.assertRaises(error.QriClientError):
+            dsref.parse_ref('peer/my_ds@QmVersion')
 
 
 if __name__ == '__main__':
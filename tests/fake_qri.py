@@ -0,0 +1,43 @@
+import json
+import os
+import stat
+import sys
+import tempfile
+
+
+SCRIPT = '''#!{python}
+import json
+import sys
+with open({responses!r}) as fp:
+    responses = json.load(fp)
+key = ' '.join(sys.argv[1:])
+if key not in responses:
+    sys.stderr.write('unknown command: %s' % key)
+    sys.exit(1)
+sys.stdout.write(responses[key])
+'''
+
+
+class FakeQri(object):
+    """A stand-in for the qri command-line binary, placed at the front of
+       PATH. Responses are given by the command's arguments"""
+    def __init__(self, responses):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.responses = os.path.join(self.tmpdir.name, 'responses.json')
+        with open(self.responses, 'w') as fp:
+            json.dump(responses, fp)
+        self.binary = os.path.join(self.tmpdir.name, 'qri')
+        with open(self.binary, 'w') as fp:
+            fp.write(SCRIPT.format(python=sys.executable,
+                                   responses=self.responses))
+        os.chmod(self.binary, os.stat(self.binary).st_mode | stat.S_IEXEC)
+        self.old_path = None
+
+    def __enter__(self):
+        self.old_path = os.environ.get('PATH', '')
+        os.environ['PATH'] = self.tmpdir.name + os.pathsep + self.old_path
+        return self
+
+    def __exit__(self, *args):
+        os.environ['PATH'] = self.old_path
+        self.tmpdir.cleanup()
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['markdown', 'pandas', 'requests', 'sqlite3']
+
+
+def import_times(code, env=None):
+    """Run code in a fresh interpreter with -X importtime, return the
+       modules that were imported mapped to their cumulative microseconds"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          cwd=ROOT, env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, check=True)
+    times = {}
+    for line in proc.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def imported(times, package):
+    return any(name == package or name.startswith(package + '.')
+               for name in times)
+
+
+class ImportTests(unittest.TestCase):
+    def test_heavy_dependencies_are_lazy(self):
+        times = import_times('import qri')
+        self.assertIn('qri', times)
+        for name in HEAVY_MODULES:
+            self.assertFalse(imported(times, name), name)
+
+    def test_finding_a_backend_stays_light(self):
+        # Short scripts that list or pull start by finding a backend, which
+        # doesn't import the heavy dependencies either
+        env = {k: v for k, v in os.environ.items() if k != 'QRI_BACKEND'}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env['QRI_PYTHON_CACHE_DIR'] = tmpdir
+            times = import_times('from qri import loader; loader.instance()',
+                                 env)
+        self.assertIn('qri.loader', times)
+        for name in HEAVY_MODULES:
+            self.assertFalse(imported(times, name), name)
+
+    def test_dependencies_load_on_use(self):
+        code = ('import io, qri.body\n'
+                'qri.body.read_result_csv(io.BytesIO(b"a\\n1\\n"))\n')
+        self.assertTrue(imported(import_times(code), 'pandas'))
+
+
+if __name__ == '__main__':
+  unittest.main()
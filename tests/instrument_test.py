@@ -0,0 +1,141 @@
+from qri import body, cache, client, cmd_util, instrument
+import fake_qri
+import logging
+import pandas
+import shutil
+import tempfile
+import time
+import unittest
+
+
+class Recorder(object):
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append(event)
+
+    def names(self):
+        return [e.name for e in self.events]
+
+
+class FakeSpan(object):
+    def __init__(self, name, start_time, spans):
+        self.name = name
+        self.start_time = start_time
+        self.attrs = {}
+        spans.append(self)
+
+    def set_attribute(self, key, val):
+        self.attrs[key] = val
+
+    def end(self, end_time):
+        self.end_time = end_time
+
+
+class FakeTracer(object):
+    def __init__(self):
+        self.spans = []
+
+    def start_span(self, name, start_time):
+        return FakeSpan(name, start_time, self.spans)
+
+
+class InstrumentTests(unittest.TestCase):
+    def setUp(self):
+        self.recorder = Recorder()
+        instrument.add_listener(self.recorder)
+        instrument.reset_stats()
+
+    def tearDown(self):
+        instrument.remove_listener(self.recorder)
+        instrument.reset_stats()
+
+    def test_span(self):
+        with instrument.span('work', kind='test') as attrs:
+            attrs['rows'] = 3
+        with self.assertRaises(ValueError):
+            with instrument.span('work'):
+                raise ValueError('bad')
+        first, second = self.recorder.events
+        self.assertEqual(first.attrs, {'kind': 'test', 'rows': 3})
+        self.assertGreaterEqual(first.duration, 0)
+        self.assertEqual(second.attrs, {'error': 'ValueError'})
+        stats = client.stats()
+        self.assertEqual(stats['work']['count'], 2)
+        self.assertEqual(stats['work']['rows'], 3)
+        self.assertIn('seconds', stats['work'])
+
+    def test_failing_listener_is_ignored(self):
+        def broken(event):
+            raise RuntimeError('broken listener')
+        instrument.add_listener(broken)
+        try:
+            with self.assertLogs('qri', level='ERROR'):
+                instrument.emit('counted')
+        finally:
+            instrument.remove_listener(broken)
+        self.assertEqual(self.recorder.names(), ['counted'])
+
+    def test_stats_reset(self):
+        instrument.emit('counted')
+        self.assertEqual(client.stats(reset=True), {'counted': {'count': 1}})
+        self.assertEqual(client.stats(), {})
+
+    def test_logging_exporter(self):
+        exporter = instrument.LoggingExporter(level=logging.INFO)
+        instrument.add_listener(exporter)
+        try:
+            with self.assertLogs('qri', level='INFO') as logs:
+                instrument.emit('parse', 0.5, rows=10)
+        finally:
+            instrument.remove_listener(exporter)
+        self.assertIn('qri parse 0.500000s', logs.output[0])
+
+    def test_opentelemetry_exporter(self):
+        tracer = FakeTracer()
+        exporter = instrument.OpenTelemetryExporter(tracer)
+        exporter(instrument.Event('http', 10.0, 0.25, {'path': '/get'}))
+        exporter(instrument.Event('cache.miss', 10.0))
+        span, = tracer.spans
+        self.assertEqual(span.name, 'qri.http')
+        self.assertEqual(span.attrs, {'path': '/get'})
+        self.assertEqual(span.end_time - span.start_time, 250000000)
+
+    def test_shell_events(self):
+        with fake_qri.FakeQri({'list': 'datasets'}):
+            cmd_util.shell_exec('qri list')
+        self.assertEqual(self.recorder.names(), ['shell.spawn', 'shell'])
+        event = self.recorder.events[1]
+        self.assertEqual(event.attrs['command'], 'qri list')
+        self.assertEqual(event.attrs['bytes'], 8)
+
+    def test_shell_stream_events(self):
+        with fake_qri.FakeQri({'get body': 'a,b\n1,2\n'}):
+            with cmd_util.shell_stream('qri get body') as stream:
+                self.assertEqual(stream.read(), b'a,b\n1,2\n')
+                time.sleep(0.2)
+        self.assertEqual(self.recorder.names(), ['shell.spawn', 'shell'])
+        event = self.recorder.events[1]
+        self.assertEqual(event.attrs, {'command': 'qri get', 'bytes': 8})
+        # Time the consumer spends with the stream isn't counted
+        self.assertLess(event.duration, 0.2)
+
+    def test_cache_and_fallback_events(self):
+        directory = tempfile.mkdtemp()
+        try:
+            c = cache.BodyCache(directory)
+            c.get('/ipfs/QmMissing')
+            c.put('/ipfs/QmBody', pandas.DataFrame({'a': [1]}))
+            c.get('/ipfs/QmBody')
+        finally:
+            shutil.rmtree(directory)
+        body.apply_types(pandas.DataFrame({'n': ['1', 'x']}), {'n': 'Int64'})
+        self.assertEqual(self.recorder.names(),
+                         ['cache.miss', 'cache.hit', 'fallback'])
+        self.assertEqual(self.recorder.events[-1].attrs,
+                         {'column': 'n', 'values': 1})
+
+
+if __name__ == '__main__':
+  unittest.main()
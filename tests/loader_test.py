@@ -0,0 +1,518 @@
+from qri import body, dataset, dsref, error, loader, transport
+import asyncio
+import fake_qri
+import gzip
+import io
+import json
+import mock_loader
+import mock_server
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+
+DATASET_OBJ = {
+    'peername': 'peer',
+    'name': 'first_dataset',
+    'path': '/ipfs/QmPath',
+    'structure': {
+        'format': 'csv',
+        'formatConfig': {'headerRow': True},
+        'schema': {
+            'items': {
+                'items': [
+                    {'title': 'name', 'type': 'string'},
+                    {'title': 'count', 'type': 'integer'},
+                ],
+                'type': 'array',
+            },
+            'type': 'array',
+        },
+    },
+}
+
+CSV_BODY = 'name,count\napple,1\nbanana,2\ncherry,3\n'
+
+
+class APIRepoTests(unittest.TestCase):
+    def setUp(self):
+        self.server = mock_server.MockServer().start()
+        self.server.add('GET', '/health', 'ok', content_type='text/plain')
+        self.server.add('GET', '/get/peer/first_dataset',
+                        {'data': {'dataset': DATASET_OBJ}})
+        self.ref = dsref.Ref('peer', 'first_dataset')
+        self.structure = dataset.Structure(DATASET_OBJ['structure'])
+
+    def tearDown(self):
+        self.server.stop()
+        loader.set_instance(None)
+
+    def test_get_dataset_object(self):
+        repo = loader.LocalAPIRepo(self.server.url)
+        obj = repo.get_dataset_object(self.ref)
+        self.assertEqual(obj['path'], '/ipfs/QmPath')
+
+    def test_connections_are_reused(self):
+        repo = loader.LocalAPIRepo(self.server.url)
+        for _ in range(3):
+            repo.get_dataset_object(self.ref)
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_error_status(self):
+        repo = loader.LocalAPIRepo(self.server.url)
+        with self.assertRaises(error.QriClientError) as ctx:
+            repo.get_dataset_object(dsref.Ref('peer', 'missing'))
+        self.assertIn('not found', str(ctx.exception))
+
+    def test_retry(self):
+        self.server.fail('GET', '/get/peer/first_dataset', 503, times=2)
+        repo = loader.LocalAPIRepo(self.server.url)
+        repo.transport = transport.HTTPTransport(self.server.url, backoff=0)
+        obj = repo.get_dataset_object(self.ref)
+        self.assertEqual(obj['path'], '/ipfs/QmPath')
+        self.assertEqual(len(self.server.requests), 3)
+        # Giving up after the retries are used
+        self.server.fail('GET', '/get/peer/first_dataset', 503, times=5)
+        with self.assertRaises(error.QriClientError) as ctx:
+            repo.get_dataset_object(self.ref)
+        self.assertIn('503', str(ctx.exception))
+
+    def test_not_modified(self):
+        self.server.add('GET', '/get/peer/first_dataset',
+                        {'data': {'dataset': DATASET_OBJ}},
+                        headers={'ETag': '"v1"'})
+        repo = loader.LocalAPIRepo(self.server.url)
+        first = repo.get_dataset_object(self.ref)
+        second = repo.get_dataset_object(self.ref)
+        self.assertEqual(first, second)
+        _, _, _, _, headers = self.server.requests[-1]
+        self.assertEqual(headers.get('If-None-Match'), '"v1"')
+
+    def test_compressed_body(self):
+        self.server.add('GET', '/get/peer/first_dataset',
+                        gzip.compress(CSV_BODY.encode('utf-8')),
+                        content_type='text/csv',
+                        headers={'Content-Encoding': 'gzip'})
+        repo = loader.LocalAPIRepo(self.server.url)
+        df = repo.load_body(self.ref, self.structure)
+        self.assertEqual(list(df['count']), [1, 2, 3])
+        _, _, _, _, headers = self.server.requests[-1]
+        self.assertIn('gzip', headers.get('Accept-Encoding'))
+
+    def test_timeout(self):
+        repo = loader.CloudAPIRepo(self.server.url)
+        self.assertEqual(repo.transport.timeout, (5.0, 60.0))
+        with mock.patch.dict(os.environ, {
+                'QRI_PYTHON_HTTP_READ_TIMEOUT': '2.5'}):
+            repo = loader.CloudAPIRepo(self.server.url)
+        self.assertEqual(repo.transport.timeout, (5.0, 2.5))
+
+    def test_history(self):
+        self.server.add('GET', '/history/peer/first_dataset',
+                        {'data': [{'path': '/ipfs/QmPath'}]})
+        repo = loader.LocalAPIRepo(self.server.url)
+        objs = repo.history_objects(self.ref, offset=0, limit=10)
+        self.assertEqual(objs, [{'path': '/ipfs/QmPath'}])
+        _, _, query, _, _ = self.server.requests[-1]
+        self.assertIn('limit=10', query)
+
+    def test_load_body(self):
+        self.server.add('GET', '/get/peer/first_dataset', CSV_BODY,
+                        content_type='text/csv')
+        repo = loader.LocalAPIRepo(self.server.url)
+        df = repo.load_body(self.ref, self.structure)
+        self.assertEqual(list(df['name']), ['apple', 'banana', 'cherry'])
+        self.assertEqual(list(df['count']), [1, 2, 3])
+        _, _, query, _, _ = self.server.requests[-1]
+        self.assertIn('component=body', query)
+
+    @unittest.skipUnless(body.optional_pyarrow(), 'pyarrow is not installed')
+    def test_load_parquet_body(self):
+        import pyarrow
+        import pyarrow.parquet
+        sink = io.BytesIO()
+        pyarrow.parquet.write_table(pyarrow.table({'count': [1, 2]}), sink)
+        self.server.add('GET', '/get/peer/first_dataset', sink.getvalue(),
+                        content_type='application/octet-stream')
+        repo = loader.LocalAPIRepo(self.server.url)
+        structure = dataset.Structure({'format': 'parquet'})
+        df = repo.load_body(self.ref, structure)
+        self.assertEqual(list(df['count']), [1, 2])
+        _, _, query, _, _ = self.server.requests[-1]
+        self.assertIn('format=parquet', query)
+
+    def test_load_partial_body(self):
+        self.server.add('GET', '/get/peer/first_dataset',
+                        'name,count\nbanana,2\n', content_type='text/csv')
+        repo = loader.LocalAPIRepo(self.server.url)
+        df = repo.load_body(self.ref, self.structure, columns=['count'],
+                            limit=1, offset=1)
+        self.assertEqual(list(df.columns), ['count'])
+        self.assertEqual(list(df['count']), [2])
+        _, _, query, _, _ = self.server.requests[-1]
+        self.assertIn('offset=1&limit=1', query)
+        self.assertNotIn('all=true', query)
+
+    def test_iter_body(self):
+        self.server.add('GET', '/get/peer/first_dataset', CSV_BODY,
+                        content_type='text/csv')
+        repo = loader.CloudAPIRepo(self.server.url)
+        chunks = list(repo.iter_body(self.ref, self.structure, 2))
+        self.assertEqual([len(c) for c in chunks], [2, 1])
+
+    def paged_body(self, rows, bad=None):
+        def answer(query):
+            offset = int(query.get('offset', [0])[0])
+            limit = int(query.get('limit', [rows])[0])
+            lines = ['name,count']
+            lines += ['n%d,%s' % (i, 'x' if i == bad else i) for i in range(
+                offset, min(rows, offset + limit))]
+            return '\n'.join(lines) + '\n'
+        self.server.add('GET', '/get/peer/first_dataset', answer,
+                        content_type='text/csv')
+        return dataset.Structure(dict(DATASET_OBJ['structure'], entries=rows))
+
+    def test_load_paged_body(self):
+        structure = self.paged_body(10)
+        repo = loader.CloudAPIRepo(self.server.url, page_rows=3, workers=2)
+        df = repo.load_body(self.ref, structure)
+        self.assertEqual(list(df['count']), list(range(10)))
+        self.assertEqual(list(df.index), list(range(10)))
+        pages = sorted(q for _, _, q, _, _ in self.server.requests)
+        self.assertEqual(pages, ['component=body&format=csv&download=true&'
+                                 'offset=%d&limit=%d' % p for p in
+                                 [(0, 3), (3, 3), (6, 3), (9, 1)]])
+        df = repo.load_body(self.ref, structure, limit=4, offset=5)
+        self.assertEqual(list(df['count']), [5, 6, 7, 8])
+
+    def test_load_paged_body_fallback(self):
+        structure = self.paged_body(10, bad=7)
+        repo = loader.CloudAPIRepo(self.server.url, page_rows=3, workers=2)
+        df = repo.load_body(self.ref, structure)
+        # Only pages where the column converted are fetched again
+        pages = sorted(q for _, _, q, _, _ in self.server.requests)
+        self.assertEqual(pages, ['component=body&format=csv&download=true&'
+                                 'offset=%d&limit=%d' % p for p in
+                                 [(0, 3), (0, 3), (3, 3), (3, 3), (6, 3),
+                                  (9, 1), (9, 1)]])
+        expect = loader.CloudAPIRepo(self.server.url, page_rows=0).load_body(
+            self.ref, structure)
+        self.assertEqual(list(df['count']), [str(n) for n in range(7)] +
+                         ['x', '8', '9'])
+        self.assertEqual(body.fallbacks(df), {'count': 1})
+        self.assertTrue(df.equals(expect))
+
+    def test_iter_paged_body(self):
+        structure = self.paged_body(10)
+        repo = loader.CloudAPIRepo(self.server.url, page_rows=3, workers=2)
+        chunks = list(repo.iter_body(self.ref, structure, 4))
+        self.assertEqual([len(c) for c in chunks], [4, 4, 2])
+        self.assertEqual(list(chunks[2]['count']), [8, 9])
+        self.assertEqual(list(chunks[2].index), [8, 9])
+
+    def test_small_body_not_paged(self):
+        structure = self.paged_body(3)
+        repo = loader.CloudAPIRepo(self.server.url, page_rows=3)
+        self.assertEqual(len(repo.load_body(self.ref, structure, limit=3)), 3)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIsNone(loader.LocalAPIRepo(self.server.url).page_rows)
+
+    def test_list_and_pull(self):
+        self.server.add('GET', '/list', {'data': [DATASET_OBJ]})
+        self.server.add('POST', '/pull/peer/first_dataset',
+                        {'data': {'path': '/ipfs/QmPath'}})
+        repo = loader.LocalAPIRepo(self.server.url)
+        self.assertEqual(len(repo.list_dataset_objects()), 1)
+        self.assertEqual(repo.pull_dataset(self.ref), '/ipfs/QmPath')
+
+    def test_list_paging(self):
+        self.server.add('GET', '/list/peer', {'data': [DATASET_OBJ]})
+        repo = loader.LocalAPIRepo(self.server.url)
+        repo.list_dataset_objects('peer', offset=10, limit=5, term='first')
+        _, path, query, _, _ = self.server.requests[-1]
+        self.assertEqual(path, '/list/peer')
+        self.assertEqual(query, 'offset=10&limit=5&term=first')
+
+    def test_cloud_missing_api(self):
+        repo = loader.CloudAPIRepo(self.server.url)
+        with self.assertRaises(error.CloudMissingAPIError):
+            repo.list_dataset_objects()
+        with self.assertRaises(error.CloudMissingAPIError):
+            repo.pull_dataset(self.ref)
+
+    def test_instance_uses_running_server(self):
+        # The detected backend is remembered in a temporary cache dir
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                mock.patch.dict(os.environ, {'QRI_API_URL': self.server.url,
+                                             'QRI_PYTHON_CACHE_DIR': tmpdir}):
+            os.environ.pop('QRI_BACKEND', None)
+            loader.set_instance(None)
+            inst = loader.instance()
+            self.assertIsInstance(inst, loader.CachingLoader)
+            self.assertIsInstance(inst.inner, loader.LocalAPIRepo)
+
+
+class LocalQriBinaryRepoTests(unittest.TestCase):
+    def test_sql(self):
+        query = 'SELECT name, count FROM peer/first_dataset'
+        responses = {
+            'sql --format csv ' + query: 'name,count\n007,1\nbanana,\n',
+        }
+        with fake_qri.FakeQri(responses):
+            repo = loader.LocalQriBinaryRepo()
+            types = {'name': 'string', 'count': 'Int64'}
+            df = repo.sql(query, types)
+            chunks = list(repo.iter_sql(query, types, chunksize=1))
+        self.assertEqual(list(df['name']), ['007', 'banana'])
+        self.assertEqual(str(df['count'].dtype), 'Int64')
+        self.assertEqual([len(c) for c in chunks], [1, 1])
+
+    def test_failed_command(self):
+        ref = dsref.Ref('peer', 'missing')
+        structure = dataset.Structure(dict(DATASET_OBJ['structure'],
+                                           format='json'))
+        with fake_qri.FakeQri({}):
+            repo = loader.LocalQriBinaryRepo()
+            with self.assertRaisesRegex(error.QriClientError,
+                                        'unknown command: sql'):
+                repo.sql('SELECT nope FROM')
+            with self.assertRaisesRegex(error.QriClientError,
+                                        'unknown command: sql'):
+                list(repo.iter_sql('SELECT nope FROM'))
+            with self.assertRaisesRegex(error.QriClientError,
+                                        'unknown command: get body'):
+                repo.load_body(ref, structure)
+            with self.assertRaisesRegex(error.QriClientError,
+                                        'unknown command: get body'):
+                asyncio.run(repo.aload_body(ref, structure))
+
+    def test_load_partial_body(self):
+        responses = {
+            'get body --limit 2 --offset 1 peer/first_dataset':
+                'name,count\nbanana,2\ncherry,3\n',
+        }
+        structure = dataset.Structure(DATASET_OBJ['structure'])
+        with fake_qri.FakeQri(responses):
+            repo = loader.LocalQriBinaryRepo()
+            df = repo.load_body(dsref.Ref('peer', 'first_dataset'), structure,
+                                columns=['name'], limit=2, offset=1)
+        self.assertEqual(list(df['name']), ['banana', 'cherry'])
+        self.assertEqual(list(df.columns), ['name'])
+
+    def test_load_large_body(self):
+        responses = {'get body peer/first_dataset': CSV_BODY}
+        structure = dataset.Structure(dict(DATASET_OBJ['structure'],
+                                           length=len(CSV_BODY)))
+        env = {'QRI_PYTHON_PARALLEL_PARSE_BYTES': '8',
+               'QRI_PYTHON_PARSE_WORKERS': '2'}
+        with fake_qri.FakeQri(responses), mock.patch.dict(os.environ, env), \
+                mock.patch.object(body, 'read_csv_parallel',
+                                  wraps=body.read_csv_parallel) as parallel:
+            repo = loader.LocalQriBinaryRepo()
+            df = repo.load_body(dsref.Ref('peer', 'first_dataset'), structure)
+        self.assertEqual(list(df['count']), [1, 2, 3])
+        self.assertEqual(parallel.call_args[0][2], 2)
+        self.assertEqual(repo._parse_workers(structure, limit=2), 1)
+
+    def test_history(self):
+        versions = [{'path': '/ipfs/QmSecond'}, {'path': '/ipfs/QmFirst'}]
+        responses = {
+            'log --format json --offset 0 --limit 2 peer/first_dataset':
+                json.dumps(versions),
+        }
+        with fake_qri.FakeQri(responses):
+            repo = loader.LocalQriBinaryRepo()
+            objs = repo.history_objects(dsref.Ref('peer', 'first_dataset'),
+                                        offset=0, limit=2)
+        self.assertEqual(objs, versions)
+
+    def test_list_paging(self):
+        responses = {
+            'list --format json --peer peer --offset 10 --limit 5 first':
+                json.dumps([DATASET_OBJ]),
+        }
+        with fake_qri.FakeQri(responses):
+            repo = loader.LocalQriBinaryRepo()
+            objs = repo.list_dataset_objects('peer', offset=10, limit=5,
+                                             term='first')
+        self.assertEqual(objs[0]['name'], 'first_dataset')
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingLoader(mock_loader.MockLoader):
+    def __init__(self):
+        self.calls = []
+
+    def get_dataset_object(self, ref):
+        self.calls.append(('get', ref.human()))
+        obj = dict(super(CountingLoader, self).get_dataset_object(ref))
+        obj['path'] = '/ipfs/Qm' + ref.name
+        return obj
+
+    def list_dataset_objects(self, username=None, offset=None, limit=None,
+                             term=None):
+        self.calls.append(('list', username))
+        return super(CountingLoader, self).list_dataset_objects(username)
+
+    def pull_dataset(self, ref):
+        self.calls.append(('pull', ref.human()))
+        return 'pulled'
+
+    def load_body(self, ref, structure):
+        return 'body'
+
+
+class CachingLoaderTests(unittest.TestCase):
+    def setUp(self):
+        self.inner = CountingLoader()
+        self.clock = FakeClock()
+        self.repo = loader.CachingLoader(self.inner, ttl=10, max_entries=2,
+                                         clock=self.clock)
+        self.first = dsref.Ref('my_peer', 'first_dataset')
+        self.second = dsref.Ref('my_peer', 'second_dataset')
+
+    def test_memoize_get(self):
+        a = self.repo.get_dataset_object(self.first)
+        b = self.repo.get_dataset_object(self.first)
+        self.assertIs(a, b)
+        self.assertEqual(self.inner.calls, [('get', 'my_peer/first_dataset')])
+        self.assertEqual(self.repo.stats()['hits'], 1)
+        self.assertEqual(self.repo.stats()['misses'], 1)
+
+    def test_expire(self):
+        self.repo.get_dataset_object(self.first)
+        self.clock.now = 11
+        self.repo.get_dataset_object(self.first)
+        self.assertEqual(len(self.inner.calls), 2)
+        # Lookup by immutable path never expires
+        obj = self.repo.lookup_path('/ipfs/Qmfirst_dataset')
+        self.assertEqual(obj['name'], 'first_dataset')
+
+    def test_versioned_get_uses_path(self):
+        self.repo.get_dataset_object(self.first)
+        self.clock.now = 11
+        # A reference pinned to a known path is answered even after expiry
+        pinned = dsref.Ref('my_peer', 'first_dataset', '/ipfs/Qmfirst_dataset')
+        obj = self.repo.get_dataset_object(pinned)
+        self.assertEqual(obj['name'], 'first_dataset')
+        self.assertEqual(len(self.inner.calls), 1)
+
+    def test_evict_least_recently_used(self):
+        third = dsref.Ref('other_peer', 'third_dataset')
+        self.repo.get_dataset_object(self.first)
+        self.repo.get_dataset_object(self.second)
+        self.repo.get_dataset_object(self.first)
+        self.repo.get_dataset_object(third)
+        self.inner.calls = []
+        self.repo.get_dataset_object(self.first)
+        self.repo.get_dataset_object(self.second)
+        self.assertEqual(self.inner.calls, [('get', 'my_peer/second_dataset')])
+
+    def test_pull_invalidates(self):
+        self.repo.get_dataset_object(self.first)
+        self.repo.get_dataset_object(self.second)
+        self.repo.list_dataset_objects()
+        self.repo.pull_dataset(self.first)
+        self.inner.calls = []
+        self.repo.get_dataset_object(self.first)
+        self.repo.get_dataset_object(self.second)
+        self.repo.list_dataset_objects()
+        self.assertEqual(self.inner.calls, [('get', 'my_peer/first_dataset'),
+                                            ('list', None)])
+
+    def test_async_get_is_memoized(self):
+        loop = asyncio.new_event_loop()
+        try:
+            for _ in range(2):
+                loop.run_until_complete(
+                    self.repo.aget_dataset_object(self.first))
+        finally:
+            loop.close()
+        self.assertEqual(self.inner.calls, [('get', 'my_peer/first_dataset')])
+
+    def test_passthrough(self):
+        self.assertEqual(self.repo.load_body(self.first, None), 'body')
+
+
+class DetectRepoTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        # Nothing answers on this port, and no qri binary is on PATH
+        self.env = mock.patch.dict(os.environ, {
+            'QRI_PYTHON_CACHE_DIR': self.dir.name,
+            'QRI_API_URL': 'http://127.0.0.1:9',
+            'PATH': self.dir.name,
+        })
+        self.env.start()
+        for name in ('QRI_BACKEND', 'QRI_BINARY', 'QRI_PYTHON_BACKEND_TTL'):
+            os.environ.pop(name, None)
+
+    def tearDown(self):
+        self.env.stop()
+        self.dir.cleanup()
+
+    def state(self):
+        with open(os.path.join(self.dir.name, 'backend.json')) as fp:
+            return json.load(fp)
+
+    def test_explicit_backend(self):
+        os.environ['QRI_BACKEND'] = 'binary'
+        os.environ['QRI_BINARY'] = '/opt/qri/bin/qri'
+        repo = loader.detect_repo()
+        self.assertIsInstance(repo, loader.LocalQriBinaryRepo)
+        self.assertEqual(repo.binary, '/opt/qri/bin/qri')
+        os.environ['QRI_BACKEND'] = 'cloud'
+        self.assertIsInstance(loader.detect_repo(), loader.CloudAPIRepo)
+        os.environ['QRI_BACKEND'] = 'other'
+        with self.assertRaises(error.QriClientError):
+            loader.detect_repo()
+
+    def test_fall_back_to_cloud(self):
+        self.assertIsInstance(loader.detect_repo(), loader.CloudAPIRepo)
+        self.assertEqual(self.state()['backend'], 'cloud')
+
+    def test_binary_on_path(self):
+        with fake_qri.FakeQri({}) as qri:
+            repo = loader.detect_repo()
+            self.assertIsInstance(repo, loader.LocalQriBinaryRepo)
+            self.assertEqual(repo.binary, qri.binary)
+            self.assertEqual(self.state()['binary'], qri.binary)
+            # Another process reuses the remembered binary
+            with mock.patch('shutil.which') as which:
+                repo = loader.detect_repo()
+            self.assertEqual(repo.binary, qri.binary)
+            self.assertFalse(which.called)
+        # Once the binary is gone, the remembered state is ignored
+        self.assertIsInstance(loader.detect_repo(), loader.CloudAPIRepo)
+
+    def test_local_api_server(self):
+        server = mock_server.MockServer().start()
+        try:
+            server.add('GET', '/health', 'ok', content_type='text/plain')
+            os.environ['QRI_API_URL'] = server.url
+            self.assertIsInstance(loader.detect_repo(), loader.LocalAPIRepo)
+            self.assertEqual(self.state()['backend'], 'api')
+        finally:
+            server.stop()
+        # A remembered server that stopped answering is not used
+        self.assertIsInstance(loader.detect_repo(), loader.CloudAPIRepo)
+
+    def test_state_expires(self):
+        loader.detect_repo()
+        os.environ['QRI_PYTHON_BACKEND_TTL'] = '0'
+        with fake_qri.FakeQri({}):
+            self.assertIsInstance(loader.detect_repo(),
+                                  loader.LocalQriBinaryRepo)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -36,8 +36,17 @@ MOCK_DATASET_REFS = {
 
 
 class MockLoader(object):
-    def list_dataset_objects(self, username=None):
-        return MOCK_DATASET_LIST
+    def list_dataset_objects(self, username=None, offset=None, limit=None,
+                             term=None):
+        objs = MOCK_DATASET_LIST
+        if username is not None:
+            objs = [o for o in objs
+                    if username in (o.get('username'), o.get('peername'))]
+        if term:
+            objs = [o for o in objs if term in o['name']]
+        start = offset or 0
+        end = start + limit if limit is not None else None
+        return objs[start:end]
 
     def get_dataset_object(self, ref):
         ref = ref.clone()
@@ -51,12 +60,14 @@ class MockLoader(object):
 
 class SettableLoader(object):
     def __init__(self, list_response=None, get_responses=None,
-                 body_responses=None):
+                 body_responses=None, chunk_responses=None):
         self.list_response = list_response
         self.get_responses = get_responses or {}
         self.body_responses = body_responses or {}
+        self.chunk_responses = chunk_responses or {}
 
-    def list_dataset_objects(self, username=None):
+    def list_dataset_objects(self, username=None, offset=None, limit=None,
+                             term=None):
         if self.list_response is None:
             raise RuntimeError('Got unexpected call to list_dataset_objects')
         return self.list_response
@@ -73,9 +84,18 @@ class SettableLoader(object):
         except KeyError:
             raise RuntimeError('Got unexpected call to load_body')
 
+    def iter_body(self, ref, structure, chunksize):
+        try:
+            chunks = self.chunk_responses[ref.human()]
+        except KeyError:
+            raise RuntimeError('Got unexpected call to iter_body')
+        for chunk in chunks:
+            yield chunk
+
 
 class NullLoader(object):
-    def list_dataset_objects(self, username=None):
+    def list_dataset_objects(self, username=None, offset=None, limit=None,
+                             term=None):
         raise RuntimeError('Cannot list_dataset_objects with NullLoader')
 
     def get_dataset_object(self, username=None):
@@ -83,3 +103,6 @@ class NullLoader(object):
 
     def load_body(self, username=None):
         raise RuntimeError('Cannot load_body with NullLoader')
+
+    def iter_body(self, ref, structure, chunksize):
+        raise RuntimeError('Cannot iter_body with NullLoader')
@@ -0,0 +1,95 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+
+class MockServer(object):
+    """A stand-in for a qri API server, running in a background thread.
+       Responses are registered by method and path, ignoring the query"""
+    def __init__(self):
+        self.routes = {}
+        self.failures = {}
+        self.requests = []
+        self.clients = set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive, so that connection reuse is visible
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server._handle(self, 'GET')
+
+            def do_POST(self):
+                server._handle(self, 'POST')
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       args=(0.01,))
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def add(self, method, path, body, status=200,
+            content_type='application/json', headers=None):
+        """Answer requests to path with body, which can be a function of the
+           query string"""
+        if callable(body):
+            self.routes[(method, path)] = (status, body, content_type,
+                                           headers or {})
+            return
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.routes[(method, path)] = (status, body, content_type,
+                                       headers or {})
+
+    def fail(self, method, path, status, times=1):
+        """Answer the next requests to path with an error status, before
+           going back to the registered response"""
+        self.failures[(method, path)] = [status] * times
+
+    def _handle(self, handler, method):
+        self.clients.add(handler.client_address)
+        parts = urlsplit(handler.path)
+        length = int(handler.headers.get('Content-Length') or 0)
+        data = handler.rfile.read(length) if length else b''
+        self.requests.append((method, parts.path, parts.query, data,
+                              dict(handler.headers)))
+        route = self.routes.get((method, parts.path))
+        if route is None:
+            route = (404, b'{"meta": {"error": "not found"}}',
+                     'application/json', {})
+        status, body, content_type, headers = route
+        if callable(body):
+            body = body(parse_qs(parts.query))
+            if isinstance(body, str):
+                body = body.encode('utf-8')
+        failures = self.failures.get((method, parts.path))
+        if failures:
+            status, body, headers = failures.pop(), b'', {}
+        elif (headers.get('ETag') and
+                handler.headers.get('If-None-Match') == headers['ETag']):
+            status, body = 304, b''
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(body)))
+        for k, v in headers.items():
+            handler.send_header(k, v)
+        handler.end_headers()
+        handler.wfile.write(body)
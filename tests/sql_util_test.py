@@ -0,0 +1,234 @@
+from qri import aio, cache, error, loader, sql_util
+import asyncio
+import mock_loader
+import pandas
+import shutil
+import tempfile
+import unittest
+
+
+PEOPLE_OBJ = {
+    'structure': {
+        'format': 'csv',
+        'schema': {
+            'items': {
+                'items': [
+                    {'title': 'name', 'type': 'string'},
+                    {'title': 'age', 'type': 'integer'},
+                ],
+                'type': 'array',
+            },
+            'type': 'array',
+        },
+    },
+}
+
+
+class QueryLoader(mock_loader.SettableLoader):
+    def __init__(self, **kwargs):
+        super(QueryLoader, self).__init__(**kwargs)
+        self.queries = []
+
+    def get_dataset_object(self, ref):
+        if ref.human() not in self.get_responses:
+            raise error.QriClientError('dataset not found')
+        return self.get_responses[ref.human()]
+
+    def sql(self, query, types=None):
+        self.queries.append((query, types))
+        return 'result'
+
+    def iter_sql(self, query, types=None, chunksize=None):
+        self.queries.append((query, types))
+        return iter(['chunk1', 'chunk2'])
+
+
+class SqlUtilTests(unittest.TestCase):
+    def tearDown(self):
+        loader.set_instance(None)
+
+    def test_bind_positional(self):
+        query = sql_util.bind_params(
+            "SELECT * FROM me/ds WHERE a = ? AND b = '?' AND c IN (?, ?, ?)",
+            ["it's", 2, None, True])
+        self.assertEqual(query, "SELECT * FROM me/ds WHERE a = 'it''s' AND "
+                                "b = '?' AND c IN (2, NULL, TRUE)")
+
+    def test_bind_named(self):
+        query = sql_util.bind_params('SELECT * FROM me/ds WHERE a > :low '
+                                     "AND b = ':low' AND c < :high",
+                                     {'low': 1.5, 'high': 3})
+        self.assertEqual(query, 'SELECT * FROM me/ds WHERE a > 1.5 '
+                                "AND b = ':low' AND c < 3")
+
+    def test_bind_errors(self):
+        with self.assertRaises(error.QriClientError):
+            sql_util.bind_params('a = ? AND b = ?', [1])
+        with self.assertRaises(error.QriClientError):
+            sql_util.bind_params('a = ?', [1, None])
+        with self.assertRaises(error.QriClientError):
+            sql_util.bind_params('a = :missing', {})
+        with self.assertRaises(error.QriClientError):
+            sql_util.bind_params('a = ?', [object()])
+
+    def test_referenced_refs(self):
+        refs = sql_util.referenced_refs(
+            "SELECT * FROM me/people JOIN other/places ON a = b "
+            "WHERE c = 'not/aref' AND d IN (SELECT x FROM me/people)")
+        self.assertEqual([r.human() for r in refs],
+                         ['me/people', 'other/places'])
+        refs = sql_util.referenced_refs(
+            'SELECT age/age AS r, a / b FROM me/people p, other/places AS q '
+            'join more/things ON x/y = 1')
+        self.assertEqual([r.human() for r in refs],
+                         ['me/people', 'other/places', 'more/things'])
+
+    def test_run(self):
+        repo = QueryLoader(get_responses={'me/people': PEOPLE_OBJ})
+        loader.set_instance(repo)
+        result = sql_util.run('SELECT * FROM me/people WHERE age > ? '
+                              'UNION SELECT * FROM me/missing', [30])
+        self.assertEqual(result, 'result')
+        query, types = repo.queries[0]
+        self.assertEqual(query, 'SELECT * FROM me/people WHERE age > 30 '
+                                'UNION SELECT * FROM me/missing')
+        self.assertEqual(types, {'name': 'string', 'age': 'Int64'})
+
+    def test_run_stream(self):
+        loader.set_instance(QueryLoader())
+        chunks = sql_util.run('SELECT 1', stream=True)
+        self.assertEqual(list(chunks), ['chunk1', 'chunk2'])
+
+
+
+CACHED_PEOPLE_OBJ = dict(PEOPLE_OBJ, bodyPath='/ipfs/QmPeopleBody')
+
+
+class LocalEngineTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        cache.set_instance(cache.BodyCache(self.dir))
+        sql_util._engine = None
+
+    def tearDown(self):
+        loader.set_instance(None)
+        cache.set_instance(None)
+        sql_util._engine = None
+        shutil.rmtree(self.dir)
+
+    def people(self):
+        return pandas.DataFrame({
+            'name': pandas.array(['ann', 'bob', 'cy'], dtype='string'),
+            'age': pandas.array([41, 29, 35], dtype='Int64'),
+        })
+
+    def test_replace_refs(self):
+        query = sql_util.replace_refs(
+            "SELECT * FROM me/people WHERE a = 'me/people' AND b IN "
+            "(SELECT x FROM other/places)", {'me/people': 't1'})
+        self.assertEqual(query, "SELECT * FROM \"t1\" WHERE a = 'me/people' "
+                                "AND b IN (SELECT x FROM other/places)")
+        query = sql_util.replace_refs('SELECT me/people FROM other/places, '
+                                      'me/people', {'me/people': 't1'})
+        self.assertEqual(query, 'SELECT me/people FROM other/places, "t1"')
+
+    def test_run_cached(self):
+        cache.instance().put('/ipfs/QmPeopleBody', self.people())
+        repo = QueryLoader(get_responses={'me/people': CACHED_PEOPLE_OBJ})
+        loader.set_instance(repo)
+        df = sql_util.run('SELECT name, age FROM me/people WHERE age > ? '
+                          'ORDER BY age', [30])
+        self.assertEqual(repo.queries, [])
+        self.assertEqual(list(df['name']), ['cy', 'ann'])
+        self.assertEqual(str(df['age'].dtype), 'Int64')
+        self.assertEqual(str(df['name'].dtype), 'string')
+
+    def test_run_loaded(self):
+        cache.set_instance(cache.NullCache())
+        people = self.people()
+        sql_util.local_engine().remember('/ipfs/QmPeopleBody', people)
+        repo = QueryLoader(get_responses={'me/people': CACHED_PEOPLE_OBJ})
+        loader.set_instance(repo)
+        chunks = sql_util.run('SELECT COUNT(*) AS n FROM me/people',
+                              stream=True)
+        self.assertEqual([list(c['n']) for c in chunks], [[3]])
+        self.assertEqual(repo.queries, [])
+
+    def test_run_division(self):
+        cache.instance().put('/ipfs/QmPeopleBody', self.people())
+        repo = QueryLoader(get_responses={'me/people': CACHED_PEOPLE_OBJ})
+        loader.set_instance(repo)
+        df = sql_util.run('SELECT age/age AS r FROM me/people',
+                          engine='local')
+        self.assertEqual(list(df['r']), [1, 1, 1])
+
+    def test_sqlite_semantics(self):
+        # The local engine answers as sqlite does, which can differ from
+        # qri: integer division truncates and LIKE ignores case
+        cache.instance().put('/ipfs/QmPeopleBody', self.people())
+        repo = QueryLoader(get_responses={'me/people': CACHED_PEOPLE_OBJ})
+        loader.set_instance(repo)
+        df = sql_util.run('SELECT age/2 AS half FROM me/people',
+                          engine='local')
+        self.assertEqual(list(df['half']), [20, 14, 17])
+        df = sql_util.run("SELECT name FROM me/people WHERE name LIKE 'ANN'")
+        self.assertEqual(list(df['name']), ['ann'])
+        self.assertEqual(repo.queries, [])
+
+    def test_aio_sql(self):
+        cache.instance().put('/ipfs/QmPeopleBody', self.people())
+        repo = QueryLoader(get_responses={'me/people': CACHED_PEOPLE_OBJ})
+        loader.set_instance(repo)
+        df = asyncio.run(aio.sql('SELECT name FROM me/people WHERE age > ?',
+                                 [30], engine='local'))
+        self.assertEqual(list(df['name']), ['ann', 'cy'])
+        self.assertEqual(repo.queries, [])
+
+    def test_stream_is_lazy(self):
+        engine = sql_util.LocalEngine()
+        people = self.people()
+        engine.remember('/ipfs/QmPeopleBody', people)
+        chunks = engine.run('SELECT name FROM me/people ORDER BY age',
+                            {'me/people': '/ipfs/QmPeopleBody'}, stream=True,
+                            chunksize=2)
+        first = next(chunks)
+        self.assertEqual(list(first['name']), ['bob', 'cy'])
+        second = next(chunks)
+        self.assertEqual(list(second.index), [2])
+        self.assertEqual(list(chunks), [])
+        self.assertEqual(engine.reading, 0)
+
+    def test_evict(self):
+        engine = sql_util.LocalEngine(max_bytes=1)
+        people = self.people()
+        engine.remember('/ipfs/QmOne', people)
+        engine.remember('/ipfs/QmTwo', people)
+        engine.run('SELECT * FROM me/one', {'me/one': '/ipfs/QmOne'})
+        self.assertEqual(list(engine.tables), ['/ipfs/QmOne'])
+        df = engine.run('SELECT * FROM me/two', {'me/two': '/ipfs/QmTwo'})
+        self.assertEqual(len(df), 3)
+        # Only the table the last query needed is kept
+        self.assertEqual(list(engine.tables), ['/ipfs/QmTwo'])
+        names = engine.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        self.assertEqual(len(names), 1)
+
+    def test_fallback(self):
+        repo = QueryLoader(get_responses={'me/people': CACHED_PEOPLE_OBJ})
+        loader.set_instance(repo)
+        self.assertEqual(sql_util.run('SELECT * FROM me/people'), 'result')
+        with self.assertRaises(error.QriClientError):
+            sql_util.run('SELECT * FROM me/people', engine='local')
+        # Queries sqlite can't run are handed to qri
+        cache.instance().put('/ipfs/QmPeopleBody', self.people())
+        self.assertEqual(sql_util.run('SELECT nope FROM me/people'), 'result')
+        with self.assertRaises(error.QriClientError):
+            sql_util.run('SELECT nope FROM me/people', engine='local')
+        self.assertEqual(sql_util.run('SELECT * FROM me/people',
+                                      engine='qri'), 'result')
+        with self.assertRaises(error.QriClientError):
+            sql_util.run('SELECT 1', engine='duck')
+
+
+if __name__ == '__main__':
+  unittest.main()
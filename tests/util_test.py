@@ -12,14 +12,34 @@ class UtilTests(unittest.TestCase):
         self.assertEqual(util.to_snake_case('SomeNameLotsOfCaps'),
                          'some_name_lots_of_caps')
 
-    def test_set_fields(self):
-        class Component(object):
-            pass
-        component = Component()
-        util.set_fields(component, {'a': 1, 'b': 2}, ['b', 'c'])
-        self.assertFalse(hasattr(component, 'a'))
-        self.assertEqual(component.b, 2)
-        self.assertIsNone(component.c)
+    def test_component(self):
+        class Component(util.Component):
+            FIELDS = ['someField', 'downloadURL']
+        component = Component({'someField': 1, 'other': 2})
+        self.assertEqual(component.some_field, 1)
+        self.assertIsNone(component.download_url)
+        self.assertEqual(Component.__slots__, ('some_field', 'download_url'))
+        self.assertEqual(util.build_repr(component), "{'some_field': 1}")
+        with self.assertRaises(AttributeError):
+            component.other = 2
+        self.assertIsNone(Component(None).some_field)
+
+    def test_field_map(self):
+        self.assertEqual(util.field_map(('bodySize', 'path')),
+                         (('bodySize', 'body_size'), ('path', 'path')))
+
+    def test_lazy_module(self):
+        mod = util.LazyModule('json')
+        self.assertEqual(mod.dumps([1]), '[1]')
+        self.assertIn('dumps', vars(mod))
+        with self.assertRaises(AttributeError):
+            mod.not_a_function
+
+    def test_ordered_map(self):
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            result = util.ordered_map(executor, lambda n: n * 2, range(10), 2)
+            self.assertEqual(list(result), [n * 2 for n in range(10)])
 
     def test_build_repr(self):
         class Subject(object):